@@ -4,10 +4,14 @@ AI 语义重排模块
 """
 
 import asyncio
+import threading
+import hashlib
+import random
+from concurrent.futures import ThreadPoolExecutor
 import httpx
-import re
-import json
-from typing import List, Optional, Dict, Any
+import orjson
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Callable
 from dataclasses import dataclass
 
 from google import genai
@@ -15,6 +19,11 @@ from pydantic import BaseModel, Field
 
 from app.config import settings
 
+# 重排结果缓存（进程级 LRU），重复的页眉页脚/样板文本无需再次请求模型
+_RESULT_CACHE_MAX = 2048
+_result_cache: "OrderedDict[str, str]" = OrderedDict()
+_result_cache_lock = threading.Lock()
+
 @dataclass
 class ReformatResult:
     """重排结果"""
@@ -24,9 +33,41 @@ class ReformatResult:
     error: Optional[str] = None
     ai_errors: Optional[List[str]] = None
 
+# 系统提示词（所有实例共享）
+SYSTEM_PROMPT = """你是一个专业的文档排版专家。你的任务是优化从 OCR（光学字符识别）提取的文本。
+请遵循以下规则：
+1. 修复明显的 OCR 错别字和识别错误
+2. 还原正确的段落结构（合并被错误断开的句子）
+3. 识别并格式化列表（有序/无序）
+4. 保留原文的核心内容和语义，不要添加或删除信息
+5. 使用 Markdown 格式输出
+6. 如果是笔记内容，保持简洁的笔记风格"""
+
 class FormattedContent(BaseModel):
     formatted_text: str = Field(description="The corrected, reformatted, and improved text in Markdown format. Keep the original meaning but fix typos, layout, and punctuation.")
 
+class FormattedBatch(BaseModel):
+    items: List[FormattedContent] = Field(description="One entry per input chunk, in the same order as the input.")
+
+# 结构化输出 schema 与请求头模板只构建一次
+_FORMATTED_CONTENT_SCHEMA = FormattedContent.model_json_schema()
+_FORMATTED_BATCH_SCHEMA = FormattedBatch.model_json_schema()
+_OPENAI_HEADERS_TEMPLATE = {"Content-Type": "application/json"}
+
+# 可重试的 HTTP 状态码（限流与服务端临时错误）
+_RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+_RETRY_MAX_DELAY = 30.0
+
+
+def _backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """计算重试等待时间：优先使用 Retry-After，否则指数退避 + 随机抖动"""
+    if retry_after:
+        try:
+            return min(float(retry_after), _RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    return min(2 ** attempt + random.random(), _RETRY_MAX_DELAY)
+
 class AIReformatter:
     """AI 语义重排器"""
     
@@ -35,22 +76,74 @@ class AIReformatter:
         api_url: str = None,
         api_key: str = None,
         model: str = None,
-        max_chunk_chars: int = 4000  # Gemini Flash 支持长上下文，增加分块大小
+        max_chunk_chars: int = 4000,  # Gemini Flash 支持长上下文，增加分块大小
+        max_concurrency: int = None,
+        batch_size: int = None,
+        max_retries: int = None
     ):
         self.api_key = api_key or getattr(settings, 'AI_API_KEY', '')
+        self._auth = f"Bearer {self.api_key}"
         self.api_url = api_url 
         # 如果未指定模型，且是 Gemini，使用较新的 Flash 模型
         self.model = model or getattr(settings, 'AI_MODEL', 'gemini-2.0-flash')
         self.max_chunk_chars = max_chunk_chars
+        self.max_concurrency = max_concurrency or getattr(settings, 'AI_MAX_CONCURRENCY', 8)
+        # 全局准入控制：所有页面的所有分块共用同一个信号量，避免触发服务商限流
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+        # 单次 Gemini 请求合并的分块数（<=1 表示逐块请求）
+        self.batch_size = batch_size or getattr(settings, 'AI_BATCH_SIZE', 8)
+        # 限流/服务端错误的最大重试次数（在信号量内重试，保持全局准入控制）
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'AI_MAX_RETRIES', 3)
         
-        self.system_prompt = """你是一个专业的文档排版专家。你的任务是优化从 OCR（光学字符识别）提取的文本。
-请遵循以下规则：
-1. 修复明显的 OCR 错别字和识别错误
-2. 还原正确的段落结构（合并被错误断开的句子）
-3. 识别并格式化列表（有序/无序）
-4. 保留原文的核心内容和语义，不要添加或删除信息
-5. 使用 Markdown 格式输出
-6. 如果是笔记内容，保持简洁的笔记风格"""
+        self.system_prompt = SYSTEM_PROMPT
+
+        # 长连接 HTTP 客户端，跨分块/页面复用 TCP/TLS 连接池
+        self._client: Optional[httpx.AsyncClient] = None
+        # Gemini SDK 客户端，首次使用时创建并在所有分块间复用
+        self._genai_client: Optional[genai.Client] = None
+        # SDK 无原生异步接口时使用的专用线程池
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_genai(self) -> genai.Client:
+        """惰性创建共享的 Gemini 客户端"""
+        if self._genai_client is None:
+            self._genai_client = genai.Client(api_key=self.api_key)
+        return self._genai_client
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        """惰性创建共享的 HTTP 客户端"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=50,
+                    keepalive_expiry=30
+                ),
+                timeout=httpx.Timeout(60.0)
+            )
+        return self._client
+
+    async def _run_sync(self, func, *args, **kwargs):
+        """在专用线程池中运行同步 SDK 调用（旧版 SDK 无 aio 接口时的降级路径）"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+    async def aclose(self) -> None:
+        """关闭共享的 HTTP 客户端"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def __aenter__(self) -> "AIReformatter":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
 
     def _split_into_chunks(self, text: str) -> List[str]:
         """将文本分割成适合 AI 处理的小块"""
@@ -59,44 +152,71 @@ class AIReformatter:
         
         chunks = []
         paragraphs = text.split('\n\n')
-        current_chunk = ""
+        max_chars = self.max_chunk_chars
+        # 用列表累积段落并记录长度，避免字符串反复拼接带来的 O(N²) 复制
+        current_parts: List[str] = []
+        current_len = 0
         
         for para in paragraphs:
-            if len(current_chunk) + len(para) + 2 <= self.max_chunk_chars:
-                current_chunk += para + "\n\n"
+            para_len = len(para)
+            if current_len + para_len + 2 <= max_chars:
+                current_parts.append(para)
+                current_len += para_len + 2
             else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
+                if current_parts:
+                    chunks.append("\n\n".join(current_parts).strip())
                 # 如果单个段落太长，切分处理
-                if len(para) > self.max_chunk_chars:
-                    for i in range(0, len(para), self.max_chunk_chars):
-                        chunks.append(para[i:i + self.max_chunk_chars])
-                    current_chunk = ""
+                if para_len > max_chars:
+                    for i in range(0, para_len, max_chars):
+                        chunks.append(para[i:i + max_chars])
+                    current_parts = []
+                    current_len = 0
                 else:
-                    current_chunk = para + "\n\n"
+                    current_parts = [para]
+                    current_len = para_len + 2
         
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
+        if current_parts:
+            last_chunk = "\n\n".join(current_parts).strip()
+            if last_chunk:
+                chunks.append(last_chunk)
         
         return chunks if chunks else [text]
 
+    def _is_claude(self) -> bool:
+        """判断是否为 Anthropic Claude 模型（支持 cache_control 显式缓存）"""
+        return "claude" in (self.model or "").lower() or "anthropic" in (self.api_url or "").lower()
+
+    async def _gemini_generate(self, contents: str, schema: Dict[str, Any]):
+        """以系统提示词为固定前缀调用 Gemini，返回原始响应"""
+        client = self._get_genai()
+        
+        # 静态系统提示词放在 system_instruction 中作为稳定前缀，动态文本只放在 contents 中
+        config = {
+            "response_mime_type": "application/json",
+            "response_json_schema": schema,
+            "system_instruction": self.system_prompt,
+        }
+        
+        kwargs = {
+            "model": self.model,
+            "contents": contents,
+            "config": config,
+        }
+        for attempt in range(self.max_retries + 1):
+            try:
+                if hasattr(client, "aio"):
+                    # 原生异步接口，直接在事件循环上等待
+                    return await client.aio.models.generate_content(**kwargs)
+                return await self._run_sync(client.models.generate_content, **kwargs)
+            except Exception as e:
+                if getattr(e, "code", None) not in _RETRYABLE_STATUS or attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(_backoff_delay(attempt))
+
     async def _call_gemini_sdk(self, text: str) -> ReformatResult:
         """使用 Google GenAI SDK 调用"""
         try:
-            client = genai.Client(api_key=self.api_key)
-            
-            # 在线程中运行同步 SDK 调用
-            def call():
-                return client.models.generate_content(
-                    model=self.model,
-                    contents=f"{self.system_prompt}\n\n待处理文本：\n{text}",
-                    config={
-                        "response_mime_type": "application/json",
-                        "response_json_schema": FormattedContent.model_json_schema(),
-                    },
-                )
-
-            response = await asyncio.to_thread(call)
+            response = await self._gemini_generate(f"待处理文本：\n{text}", _FORMATTED_CONTENT_SCHEMA)
             
             # 解析结构化输出
             try:
@@ -120,13 +240,47 @@ class AIReformatter:
                 error=f"Gemini SDK Error: {str(e)}"
             )
 
-    async def _call_openai_compatible(self, text: str, client: httpx.AsyncClient) -> ReformatResult:
+    async def _call_gemini_batch(self, texts: List[str]) -> Optional[List[str]]:
+        """
+        将多个分块合并为一次 Gemini 请求
+        
+        Returns:
+            与输入顺序一致的重排文本列表；请求失败或返回条目数不匹配时返回 None
+        """
+        parts = [f"以下共 {len(texts)} 段待处理文本，请逐段独立处理，按原顺序返回与输入数量一致的 items 列表。"]
+        for i, text in enumerate(texts, 1):
+            parts.append(f"### 第 {i} 段\n{text}")
+        try:
+            response = await self._gemini_generate("\n\n".join(parts), _FORMATTED_BATCH_SCHEMA)
+            batch = FormattedBatch.model_validate_json(response.text)
+        except Exception as e:
+            print(f"批量请求失败，改为逐段请求: {e}")
+            return None
+        if len(batch.items) != len(texts):
+            print(f"批量返回条目数不匹配 ({len(batch.items)}/{len(texts)})，改为逐段请求")
+            return None
+        return [item.formatted_text for item in batch.items]
+
+    async def _call_openai_compatible(self, text: str) -> ReformatResult:
         """使用 HTTP 调用 OpenAI 兼容接口 (DeepSeek/其他)"""
         try:
+            headers = {**_OPENAI_HEADERS_TEMPLATE, "Authorization": self._auth}
+            if self._is_claude():
+                # Claude 需要显式标记缓存断点；OpenAI 等会自动缓存相同前缀
+                system_content = [{
+                    "type": "text",
+                    "text": self.system_prompt,
+                    "cache_control": {"type": "ephemeral"}
+                }]
+                headers["anthropic-beta"] = "prompt-caching-2024-07-31"
+            else:
+                system_content = self.system_prompt
+
+            # 静态系统提示词在前，每块的动态文本在后，保证前缀可被缓存
             payload = {
                 "model": self.model,
                 "messages": [
-                    {"role": "system", "content": self.system_prompt},
+                    {"role": "system", "content": system_content},
                     {"role": "user", "content": text}
                 ],
                 "temperature": 0.3
@@ -142,41 +296,153 @@ class AIReformatter:
             else:
                 url = base_url
 
-            response = await client.post(
-                url,
-                json=payload,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.api_key}"
-                },
-                timeout=60.0
-            )
+            client = await self._get_client()
+            body = orjson.dumps(payload)
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await client.post(
+                        url,
+                        content=body,
+                        headers=headers,
+                        timeout=60.0
+                    )
+                except httpx.TransportError:
+                    if attempt >= self.max_retries:
+                        raise
+                    await asyncio.sleep(_backoff_delay(attempt))
+                    continue
+                if response.status_code not in _RETRYABLE_STATUS or attempt >= self.max_retries:
+                    break
+                await asyncio.sleep(_backoff_delay(attempt, response.headers.get("Retry-After")))
 
+            # 只读取一次响应体：成功时直接解析字节，失败时仅解码前 500 字节用于报错
+            raw = await response.aread()
             if response.status_code != 200:
-                return ReformatResult(original=text, formatted=text, success=False, error=f"HTTP {response.status_code}: {response.text}")
+                detail = raw[:500].decode("utf-8", "replace")
+                return ReformatResult(original=text, formatted=text, success=False, error=f"HTTP {response.status_code}: {detail}")
 
-            data = response.json()
+            data = orjson.loads(raw)
             formatted = data['choices'][0]['message']['content']
             return ReformatResult(original=text, formatted=formatted, success=True)
             
         except Exception as e:
             return ReformatResult(original=text, formatted=text, success=False, error=str(e))
 
-    async def _call_ai_api(self, text: str, client: httpx.AsyncClient) -> ReformatResult:
+    def _cache_key(self, text: str) -> str:
+        """结果缓存键：接口 + 模型 + 系统提示词 + 文本内容"""
+        raw = "\x00".join([self.api_url or "", self.model, self.system_prompt, text])
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _use_gemini(self) -> bool:
+        """没有自定义 URL 或 URL 指向 Google 时使用 Gemini SDK"""
+        return not self.api_url or "googleapis.com" in self.api_url
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        with _result_cache_lock:
+            cached = _result_cache.get(key)
+            if cached is not None:
+                _result_cache.move_to_end(key)
+            return cached
+
+    def _cache_put(self, key: str, formatted: str) -> None:
+        with _result_cache_lock:
+            _result_cache[key] = formatted
+            _result_cache.move_to_end(key)
+            if len(_result_cache) > _RESULT_CACHE_MAX:
+                _result_cache.popitem(last=False)
+
+    async def _call_ai_api(self, text: str) -> ReformatResult:
         """根据配置选择调用方式"""
-        # 如果没有自定义 URL 或者 URL 为空，默认使用 Gemini SDK
-        if not self.api_url or "googleapis.com" in self.api_url:
-            return await self._call_gemini_sdk(text)
-        else:
-            # 有自定义 URL，假设是 OpenAI 兼容格式
-            return await self._call_openai_compatible(text, client)
-
-    async def reformat(self, text: str) -> Dict[str, Any]:
+        key = self._cache_key(text)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return ReformatResult(original=text, formatted=cached, success=True)
+
+        async with self._sem:
+            if self._use_gemini():
+                result = await self._call_gemini_sdk(text)
+            else:
+                # 有自定义 URL，假设是 OpenAI 兼容格式
+                result = await self._call_openai_compatible(text)
+
+        if result.success:
+            self._cache_put(key, result.formatted)
+        return result
+
+    async def _call_ai_batch(self, texts: List[str]) -> List[ReformatResult]:
+        """一次请求处理一批分块，缓存命中的分块不再发送"""
+        results: List[Optional[ReformatResult]] = [None] * len(texts)
+        missing: List[int] = []
+        for i, text in enumerate(texts):
+            cached = self._cache_get(self._cache_key(text))
+            if cached is not None:
+                results[i] = ReformatResult(original=text, formatted=cached, success=True)
+            else:
+                missing.append(i)
+        
+        formatted = None
+        if len(missing) > 1:
+            async with self._sem:
+                formatted = await self._call_gemini_batch([texts[i] for i in missing])
+        
+        if formatted is not None:
+            for i, text in zip(missing, formatted):
+                results[i] = ReformatResult(original=texts[i], formatted=text, success=True)
+                self._cache_put(self._cache_key(texts[i]), text)
+        elif missing:
+            # 单个分块或批量失败时逐段请求，保证部分失败不影响整批
+            singles = await asyncio.gather(*[self._call_ai_api(texts[i]) for i in missing])
+            for i, result in zip(missing, singles):
+                results[i] = result
+        
+        return results
+
+    async def _call_ai_many(
+        self,
+        chunks: List[str],
+        on_result: Optional[Callable[[int, ReformatResult], None]] = None
+    ) -> List[ReformatResult]:
+        """
+        并发处理多个分块
+        
+        Gemini 下按 batch_size 合并为批量请求，其他接口逐块请求；
+        每个分块完成后以 (序号, 结果) 调用 on_result。
+        """
+        if self.batch_size > 1 and self._use_gemini():
+            groups = [
+                list(range(start, min(start + self.batch_size, len(chunks))))
+                for start in range(0, len(chunks), self.batch_size)
+            ]
+            
+            async def run_group(indices: List[int]) -> List[ReformatResult]:
+                group_results = await self._call_ai_batch([chunks[i] for i in indices])
+                if on_result:
+                    for i, result in zip(indices, group_results):
+                        on_result(i, result)
+                return group_results
+            
+            grouped = await asyncio.gather(*[run_group(indices) for indices in groups])
+            return [result for group_results in grouped for result in group_results]
+        
+        async def run(idx: int, chunk: str) -> ReformatResult:
+            result = await self._call_ai_api(chunk)
+            if on_result:
+                on_result(idx, result)
+            return result
+        
+        return await asyncio.gather(*[run(idx, chunk) for idx, chunk in enumerate(chunks)])
+
+    async def reformat(
+        self,
+        text: str,
+        on_chunk_done: Optional[Callable[[bool], None]] = None
+    ) -> Dict[str, Any]:
         """
         异步并行重排文本
         
         Args:
             text: OCR 提取的原始文本
+            on_chunk_done: 每个分块完成时的回调，参数为是否成功
             
         Returns:
             包含重排结果的字典
@@ -192,12 +458,22 @@ class AIReformatter:
         
         chunks = self._split_into_chunks(text)
         
-        async with httpx.AsyncClient() as client:
-            # 并行发送所有请求
-            tasks = [self._call_ai_api(chunk, client) for chunk in chunks]
-            results = await asyncio.gather(*tasks)
+        def on_result(idx: int, result: ReformatResult):
+            if on_chunk_done:
+                on_chunk_done(result.success)
+        
+        # 并行发送所有请求（共享同一个连接池）
+        results = await self._call_ai_many(chunks, on_result)
         
-        # 合并结果
+        return self._merge_results(text, chunks, results)
+
+    def _merge_results(
+        self,
+        text: str,
+        chunks: List[str],
+        results: List[ReformatResult]
+    ) -> Dict[str, Any]:
+        """合并各分块的重排结果"""
         formatted_chunks = []
         errors = []
         success_count = 0
@@ -220,12 +496,22 @@ class AIReformatter:
             "errors": errors if errors else None
         }
 
-    async def reformat_pages(self, pages: List[Dict]) -> List[Dict]:
+    async def reformat_pages(
+        self,
+        pages: List[Dict],
+        on_chunk_done: Optional[Callable[[bool], None]] = None,
+        prechunked: Optional[List[List[str]]] = None
+    ) -> List[Dict]:
         """
         并行处理多个页面
         
+        所有页面先统一分块并去重，相同的分块（如重复的页眉页脚）只请求一次，
+        结果再分发回各页面。
+        
         Args:
             pages: OCR 结果页面列表
+            on_chunk_done: 每个分块完成时的回调，参数为是否成功（重复分块按出现次数回调）
+            prechunked: 调用方已完成的逐页分块结果（与 pages 一一对应），提供时不再重新分块
             
         Returns:
             增强后的页面列表
@@ -233,25 +519,55 @@ class AIReformatter:
         if not self.api_key:
             return pages
         
-        async def process_page(page: Dict) -> Dict:
-            text = page.get("text", "")
-            if not text.strip():
-                return page
-            
-            result = await self.reformat(text)
+        # 分块并建立 唯一分块 -> 所在位置 的映射
+        page_chunks: Dict[int, List[str]] = {}
+        unique: Dict[str, List[tuple]] = {}
+        for page_idx, page in enumerate(pages):
+            if prechunked is not None:
+                chunks = prechunked[page_idx]
+                if not chunks:
+                    continue
+            else:
+                text = page.get("text", "")
+                if not text.strip():
+                    continue
+                chunks = self._split_into_chunks(text)
+            page_chunks[page_idx] = chunks
+            for chunk_idx, chunk in enumerate(chunks):
+                unique.setdefault(chunk, []).append((page_idx, chunk_idx))
+        
+        unique_chunks = list(unique)
+        
+        def on_result(idx: int, result: ReformatResult):
+            if on_chunk_done:
+                for _ in unique[unique_chunks[idx]]:
+                    on_chunk_done(result.success)
+        
+        # 每个唯一分块只请求一次
+        unique_results = await self._call_ai_many(unique_chunks, on_result)
+        
+        # 将结果分发回各页面
+        page_results: Dict[int, List[ReformatResult]] = {
+            page_idx: [None] * len(chunks) for page_idx, chunks in page_chunks.items()
+        }
+        for chunk, result in zip(unique_chunks, unique_results):
+            for page_idx, chunk_idx in unique[chunk]:
+                page_results[page_idx][chunk_idx] = result
+        
+        for page_idx, chunks in page_chunks.items():
+            page = pages[page_idx]
+            result = self._merge_results(page.get("text", ""), chunks, page_results[page_idx])
             page["ai_formatted"] = result["formatted"]
             page["ai_success"] = result["success"]
             # 收集错误信息
             if result.get("errors"):
                 page["ai_errors"] = result["errors"]
-            return page
         
-        tasks = [process_page(page) for page in pages]
-        return await asyncio.gather(*tasks)
+        return pages
 
 
 # 便捷函数
 async def reformat_text(text: str, api_key: str = None) -> Dict[str, Any]:
     """快捷函数：重排文本"""
-    reformatter = AIReformatter(api_key=api_key)
-    return await reformatter.reformat(text)
+    async with AIReformatter(api_key=api_key) as reformatter:
+        return await reformatter.reformat(text)
@@ -12,6 +12,8 @@ from app.ai.reformatter import AIReformatter
 from app.config import settings
 from app.core.file_manager import file_manager
 from app.core.history_index import read_task_meta, write_task_meta
+from app.core.task_store import TaskStore
+from app.utils.helpers import aread_json, awrite_json
 
 router = APIRouter(prefix="/ai", tags=["AI增强"])
 
@@ -41,8 +43,10 @@ class AIStatusResponse(BaseModel):
     message: str
 
 
-# AI 处理状态存储
-ai_status = {}
+# AI 处理状态存储（配置 REDIS_URL 后多个 worker 共享）
+ai_store = TaskStore(prefix="ai")
+# 运行中的后台任务：事件循环只保留弱引用，需自行持有以免任务被回收
+_background_tasks = set()
 
 
 @router.post("/{task_id}/enhance", response_model=AIEnhanceResponse)
@@ -52,8 +56,6 @@ async def start_ai_enhance(task_id: str, options: AIEnhanceRequest):
     
     需要先完成 OCR 识别
     """
-    import json
-    
     # 检查 OCR 结果是否存在
     output_dir = file_manager.get_task_output_dir(task_id)
     result_file = output_dir / "ocr_result.json"
@@ -62,29 +64,32 @@ async def start_ai_enhance(task_id: str, options: AIEnhanceRequest):
         raise HTTPException(status_code=400, detail="请先完成 OCR 识别")
     
     # 检查是否已在处理中
-    if task_id in ai_status and ai_status[task_id]["status"] == "processing":
+    status = await ai_store.get_status(task_id)
+    if status and status.get("status") == "processing":
         raise HTTPException(status_code=400, detail="AI 增强正在处理中")
     
     # 读取 OCR 结果
-    with open(result_file, "r", encoding="utf-8") as f:
-        ocr_results = json.load(f)
+    ocr_results = await aread_json(result_file)
     
     # 初始化状态
-    ai_status[task_id] = {
-        "status": "processing",
-        "progress": 0,
-        "chunks_total": 0,
-        "chunks_processed": 0,
-        "message": "正在启动 AI 增强..."
-    }
+    await ai_store.set_status(
+        task_id,
+        status="processing",
+        progress=0,
+        chunks_total=0,
+        chunks_processed=0,
+        message="正在启动 AI 增强..."
+    )
     
     # 启动异步处理
-    asyncio.create_task(_process_ai_enhance(
+    task = asyncio.create_task(_process_ai_enhance(
         task_id, 
         ocr_results, 
         options,
         result_file
     ))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
     
     return AIEnhanceResponse(
         task_id=task_id,
@@ -100,26 +105,61 @@ async def _process_ai_enhance(
     result_file
 ):
     """异步处理 AI 增强"""
-    import json
-    
+    reformatter = AIReformatter(
+        api_url=options.api_url or settings.AI_API_URL,
+        api_key=options.api_key or settings.AI_API_KEY,
+        model=options.model or settings.AI_MODEL,
+        max_chunk_chars=options.max_chunk_chars or settings.AI_MAX_CHUNK_CHARS
+    )
+
     try:
-        reformatter = AIReformatter(
-            api_url=options.api_url or settings.AI_API_URL,
-            api_key=options.api_key or settings.AI_API_KEY,
-            model=options.model or settings.AI_MODEL,
-            max_chunk_chars=options.max_chunk_chars or settings.AI_MAX_CHUNK_CHARS
+        # 逐页分块并统计总块数（空白页不参与处理）
+        per_page_chunks = [
+            reformatter._split_into_chunks(text) if text.strip() else []
+            for text in (p.get("text", "") for p in ocr_results)
+        ]
+        total_chunks = sum(len(chunks) for chunks in per_page_chunks)
+        
+        await ai_store.set_status(
+            task_id,
+            chunks_total=total_chunks,
+            message=f"正在处理 {total_chunks} 个文本块..."
         )
         
-        # 统计总块数
-        total_text = "\n\n".join([p.get("text", "") for p in ocr_results])
-        chunks = reformatter._split_into_chunks(total_text)
-        total_chunks = len(chunks)
+        chunks_processed = 0
+        changed = asyncio.Event()
+        
+        def on_chunk_done(success: bool):
+            nonlocal chunks_processed
+            chunks_processed += 1
+            changed.set()
         
-        ai_status[task_id]["chunks_total"] = total_chunks
-        ai_status[task_id]["message"] = f"正在处理 {total_chunks} 个文本块..."
+        async def report_progress():
+            # 分块完成很密集，合并为一次写入，避免每块一次存储往返
+            while True:
+                await changed.wait()
+                changed.clear()
+                await ai_store.set_status(
+                    task_id,
+                    chunks_processed=chunks_processed,
+                    progress=min(chunks_processed / total_chunks * 100, 99) if total_chunks else 0
+                )
         
-        # 并行处理所有页面
-        enhanced_results = await reformatter.reformat_pages(ocr_results)
+        # 并行处理所有页面，每完成一个分块即更新进度
+        reporter = asyncio.create_task(report_progress())
+        try:
+            enhanced_results = await reformatter.reformat_pages(
+                ocr_results,
+                on_chunk_done=on_chunk_done,
+                prechunked=per_page_chunks
+            )
+        finally:
+            # 先停止进度写入，避免覆盖下面的最终状态
+            reporter.cancel()
+            try:
+                await reporter
+            except asyncio.CancelledError:
+                pass
         
         # 更新结果并统计成功/失败
         success_count = 0
@@ -135,57 +175,64 @@ async def _process_ai_enhance(
                     error_messages.extend(result.get("ai_errors", []))
         
         # 保存增强后的结果
-        with open(result_file, "w", encoding="utf-8") as f:
-            json.dump(ocr_results, f, ensure_ascii=False, indent=2)
+        await awrite_json(result_file, ocr_results)
         
         # 根据成功率决定状态
         if success_count == 0:
             # 全部失败
             error_msg = error_messages[0] if error_messages else "所有请求均失败，请检查 API 配置"
-            ai_status[task_id] = {
-                "status": "failed",
-                "progress": 0,
-                "chunks_total": total_chunks,
-                "chunks_processed": 0,
-                "message": f"AI 增强失败: {error_msg}"
-            }
+            await ai_store.set_status(
+                task_id,
+                status="failed",
+                progress=0,
+                chunks_total=total_chunks,
+                chunks_processed=0,
+                message=f"AI 增强失败: {error_msg}"
+            )
         elif success_count < len(enhanced_results):
             # 部分成功
-            ai_status[task_id] = {
-                "status": "completed",
-                "progress": 100,
-                "chunks_total": total_chunks,
-                "chunks_processed": success_count,
-                "message": f"部分完成 ({success_count}/{len(enhanced_results)} 页成功)"
-            }
-            write_task_meta(task_id, {"ai_enhanced": True})
+            await ai_store.set_status(
+                task_id,
+                status="completed",
+                progress=100,
+                chunks_total=total_chunks,
+                chunks_processed=success_count,
+                message=f"部分完成 ({success_count}/{len(enhanced_results)} 页成功)"
+            )
+            await asyncio.to_thread(write_task_meta, task_id, {"ai_enhanced": True})
         else:
             # 全部成功
-            ai_status[task_id] = {
-                "status": "completed",
-                "progress": 100,
-                "chunks_total": total_chunks,
-                "chunks_processed": total_chunks,
-                "message": "AI 增强完成"
-            }
-            write_task_meta(task_id, {"ai_enhanced": True})
+            await ai_store.set_status(
+                task_id,
+                status="completed",
+                progress=100,
+                chunks_total=total_chunks,
+                chunks_processed=total_chunks,
+                message="AI 增强完成"
+            )
+            await asyncio.to_thread(write_task_meta, task_id, {"ai_enhanced": True})
         
     except Exception as e:
-        ai_status[task_id] = {
-            "status": "failed",
-            "progress": 0,
-            "chunks_total": 0,
-            "chunks_processed": 0,
-            "message": f"AI 增强失败: {str(e)}"
-        }
+        await ai_store.set_status(
+            task_id,
+            status="failed",
+            progress=0,
+            chunks_total=0,
+            chunks_processed=0,
+            message=f"AI 增强失败: {str(e)}"
+        )
+    finally:
+        # 任务结束后释放连接池
+        await reformatter.aclose()
 
 
 @router.get("/{task_id}/status", response_model=AIStatusResponse)
 async def get_ai_status(task_id: str):
     """获取 AI 增强状态"""
-    if task_id not in ai_status:
+    status = await ai_store.get_status(task_id)
+    if status is None:
         # 检查是否已完成
-        meta = read_task_meta(task_id)
+        meta = await asyncio.to_thread(read_task_meta, task_id)
         if meta and meta.get("ai_enhanced"):
             return AIStatusResponse(
                 task_id=task_id,
@@ -204,7 +251,6 @@ async def get_ai_status(task_id: str):
             message="未启动 AI 增强"
         )
     
-    status = ai_status[task_id]
     return AIStatusResponse(
         task_id=task_id,
         status=status["status"],
@@ -218,16 +264,13 @@ async def get_ai_status(task_id: str):
 @router.get("/{task_id}/result")
 async def get_ai_result(task_id: str):
     """获取 AI 增强后的结果"""
-    import json
-    
     output_dir = file_manager.get_task_output_dir(task_id)
     result_file = output_dir / "ocr_result.json"
     
     if not result_file.exists():
         raise HTTPException(status_code=404, detail="结果不存在")
     
-    with open(result_file, "r", encoding="utf-8") as f:
-        results = json.load(f)
+    results = await aread_json(result_file)
     
     # 返回增强后的文本
     enhanced_pages = []
@@ -7,7 +7,7 @@ from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from typing import Literal, Optional
 from pathlib import Path
-import json
+import asyncio
 
 from app.core.file_manager import file_manager
 from app.export.txt_export import TxtExporter
@@ -15,6 +15,7 @@ from app.export.docx_export import DocxExporter
 from app.export.searchable_pdf import SearchablePDFCreator
 from app.ocr.postprocess import ProcessedPage, Paragraph
 from app.ocr.engine import OCRResult, OCRLine
+from app.utils.helpers import aread_json
 
 router = APIRouter(prefix="/export", tags=["导出"])
 
@@ -35,7 +36,7 @@ class ExportResponse(BaseModel):
     message: str
 
 
-def load_ocr_result(task_id: str) -> list:
+async def load_ocr_result(task_id: str) -> list:
     """加载 OCR 结果"""
     output_dir = file_manager.get_task_output_dir(task_id)
     result_file = output_dir / "ocr_result.json"
@@ -43,25 +44,27 @@ def load_ocr_result(task_id: str) -> list:
     if not result_file.exists():
         raise HTTPException(status_code=404, detail="OCR 结果不存在")
     
-    with open(result_file, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return await aread_json(result_file)
+
+
+def get_paragraph_texts(item: dict, use_ai_formatted: bool = False) -> list:
+    """获取单页的段落文本列表"""
+    # 如果启用 AI 增强且有 AI 结果，使用 AI 结果
+    if use_ai_formatted and item.get("ai_formatted"):
+        return [item["ai_formatted"]]
+    if "paragraphs" in item:
+        return item["paragraphs"]
+    return [item.get("text", "")]
 
 
 def convert_to_processed_pages(ocr_data: list, use_ai_formatted: bool = False) -> list:
     """将 OCR 数据转换为 ProcessedPage 对象"""
     pages = []
     for item in ocr_data:
-        paragraphs = []
-        
-        # 如果启用 AI 增强且有 AI 结果，使用 AI 结果
-        if use_ai_formatted and item.get("ai_formatted"):
-            text = item.get("ai_formatted", "")
-            paragraphs.append(Paragraph(text=text, lines=[]))
-        elif "paragraphs" in item:
-            for text in item["paragraphs"]:
-                paragraphs.append(Paragraph(text=text, lines=[]))
-        else:
-            paragraphs.append(Paragraph(text=item.get("text", ""), lines=[]))
+        paragraphs = [
+            Paragraph(text=text, lines=[])
+            for text in get_paragraph_texts(item, use_ai_formatted)
+        ]
         
         page = ProcessedPage(
             page_num=item["page"],
@@ -83,8 +86,7 @@ async def export_result(task_id: str, request: ExportRequest):
         raise HTTPException(status_code=404, detail="任务不存在")
     
     # 加载 OCR 结果
-    ocr_data = load_ocr_result(task_id)
-    pages = convert_to_processed_pages(ocr_data, use_ai_formatted=request.use_ai_formatted)
+    ocr_data = await load_ocr_result(task_id)
     
     # 准备输出目录
     output_dir = file_manager.get_task_output_dir(task_id)
@@ -95,28 +97,36 @@ async def export_result(task_id: str, request: ExportRequest):
     # 导出
     if request.format == "txt":
         output_file = output_dir / f"{original_name}_ocr.txt"
+        pages = convert_to_processed_pages(ocr_data, use_ai_formatted=request.use_ai_formatted)
         exporter = TxtExporter(include_page_numbers=request.include_page_numbers)
-        exporter.export(pages, output_file)
+        await asyncio.to_thread(exporter.export, pages, output_file)
         
     elif request.format == "md":
         output_file = output_dir / f"{original_name}_ocr.md"
         # 直接使用 TxtExporter 导出内容，Markdown 格式主要体现在内容本身（如果是 AI 处理过的）
         # 如果需要更精细的 Markdown 结构（如页码作为二级标题），可以在这里定制
-        with open(output_file, "w", encoding="utf-8") as f:
-            if request.title:
-                f.write(f"# {request.title}\n\n")
+        parts = []
+        if request.title:
+            parts.append(f"# {request.title}\n\n")
+        
+        # Markdown 只需要页码和段落文本，直接遍历原始数据，无需构造 ProcessedPage
+        for item in ocr_data:
+            if request.include_page_numbers:
+                parts.append(f"\n## 第 {item['page']} 页\n\n")
             
-            for page in pages:
-                if request.include_page_numbers:
-                    f.write(f"\n## 第 {page.page_num} 页\n\n")
-                
-                for para in page.paragraphs:
-                    f.write(f"{para.text}\n\n")
+            for text in get_paragraph_texts(item, request.use_ai_formatted):
+                parts.append(f"{text}\n\n")
+        
+        # 一次性编码并写入，避免逐段写文件
+        content = "".join(parts).encode("utf-8")
+        await asyncio.to_thread(output_file.write_bytes, content)
                     
     elif request.format == "docx":
         output_file = output_dir / f"{original_name}_ocr.docx"
+        pages = convert_to_processed_pages(ocr_data, use_ai_formatted=request.use_ai_formatted)
         exporter = DocxExporter()
-        exporter.export(
+        await asyncio.to_thread(
+            exporter.export,
             pages, 
             output_file, 
             title=request.title,
@@ -138,7 +148,7 @@ async def export_result(task_id: str, request: ExportRequest):
             ocr_results.append(result)
         
         creator = SearchablePDFCreator()
-        creator.create(pdf_path, ocr_results, output_file)
+        await asyncio.to_thread(creator.create, pdf_path, ocr_results, output_file)
     
     else:
         raise HTTPException(status_code=400, detail="不支持的导出格式")
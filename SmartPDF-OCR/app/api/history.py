@@ -3,14 +3,14 @@
 """
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from pathlib import Path
-from datetime import datetime
-import json
+import asyncio
 
 from app.core.file_manager import file_manager
-from app.core.history_index import read_task_meta
+from app.core.history_index import read_index, remove_index_entries
 
 router = APIRouter(prefix="/history", tags=["历史"])
 
@@ -28,27 +28,19 @@ class HistoryItem(BaseModel):
     outputs: List[str] = []
 
 
-@router.get("", response_model=List[HistoryItem])
-async def list_history():
-    task_ids = set()
-    if file_manager.upload_dir.exists():
-        task_ids.update([p.name for p in file_manager.upload_dir.iterdir() if p.is_dir()])
-    if file_manager.output_dir.exists():
-        task_ids.update([p.name for p in file_manager.output_dir.iterdir() if p.is_dir()])
-
+def _scan_history() -> List[HistoryItem]:
+    """根据历史索引生成历史列表（阻塞 I/O，在线程中执行）"""
     items: List[HistoryItem] = []
-    for task_id in task_ids:
+    removed: List[str] = []
+    for task_id, meta in read_index().items():
         files = file_manager.list_task_files(task_id)
+        if not files["uploads"] and not files["outputs"]:
+            # 任务目录已被删除（如过期清理），记入索引，之后不再检查
+            removed.append(task_id)
+            continue
         outputs = files["outputs"]
         has_result = "ocr_result.json" in outputs
-        meta = read_task_meta(task_id) or {}
         filename = meta.get("filename") or (files["uploads"][0] if files["uploads"] else None)
-        updated_at = meta.get("updated_at")
-
-        if not updated_at:
-            output_dir = file_manager.output_dir / task_id
-            if output_dir.exists():
-                updated_at = datetime.fromtimestamp(output_dir.stat().st_mtime).isoformat()
 
         items.append(
             HistoryItem(
@@ -59,32 +51,39 @@ async def list_history():
                 page_count=meta.get("page_count"),
                 status=meta.get("status") or ("completed" if has_result else "uploaded"),
                 created_at=meta.get("created_at"),
-                updated_at=updated_at,
+                updated_at=meta.get("updated_at"),
                 has_result=has_result,
                 outputs=outputs
             )
         )
 
+    remove_index_entries(removed)
     items.sort(key=lambda x: x.updated_at or "", reverse=True)
     return items
 
 
+@router.get("", response_model=List[HistoryItem])
+async def list_history():
+    return await asyncio.to_thread(_scan_history)
+
+
 @router.get("/{task_id}/result")
 async def get_history_result(task_id: str):
-    output_dir = file_manager.get_task_output_dir(task_id)
-    result_file = output_dir / "ocr_result.json"
-    if not result_file.exists():
+    # 不使用 get_task_output_dir：只读请求不应创建目录
+    result_file = file_manager.output_dir / task_id / "ocr_result.json"
+    if not await asyncio.to_thread(result_file.is_file):
         raise HTTPException(status_code=404, detail="OCR 结果不存在")
-    with open(result_file, "r", encoding="utf-8") as f:
-        return json.load(f)
+    # 文件本身就是 JSON，直接流式发送，无需解析再序列化
+    return FileResponse(result_file, media_type="application/json")
 
 
 @router.delete("/{task_id}")
 async def delete_history(task_id: str):
     """删除历史记录"""
-    files = file_manager.list_task_files(task_id)
+    files = await asyncio.to_thread(file_manager.list_task_files, task_id)
     if not files["uploads"] and not files["outputs"]:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    file_manager.cleanup_task(task_id)
+    await asyncio.to_thread(file_manager.cleanup_task, task_id)
+    await asyncio.to_thread(remove_index_entries, [task_id])
     return {"message": "已删除"}
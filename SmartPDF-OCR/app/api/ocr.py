@@ -3,33 +3,42 @@ OCR 识别 API
 """
 
 from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict
 from pathlib import Path
-import json
+import asyncio
 from datetime import datetime
 
 from app.core.file_manager import file_manager
-from app.core.pdf_detector import PDFDetector
+from app.core.pdf_detector import get_task_pdf_info, extract_text_batch_async
 from app.core.pdf_renderer import PDFRenderer
-from app.ocr.engine import OCREngine
+from app.ocr.engine import OCREngine, get_engine
 from app.ocr.postprocess import PostProcessor
-from app.preprocess import denoise, binarize, deskew
+from app.core.pool import (
+    PREPROCESS_WORKERS,
+    get_preprocess_pool,
+    preprocess_page,
+    prefetch,
+    load_shared_image,
+    discard_future_image,
+)
 from app.core.history_index import write_task_meta
+from app.core.task_store import task_store
+from app.utils.helpers import awrite_json
+from app.utils.sse import status_event_response
 from app.config import settings
 
 router = APIRouter(prefix="/ocr", tags=["OCR"])
 
-# 任务状态存储（生产环境建议使用 Redis）
-task_status: Dict[str, Dict[str, Any]] = {}
 
 
 class OCRRequest(BaseModel):
     """OCR 请求参数"""
     preprocess: bool = True  # 是否预处理
-    denoise: bool = True
-    binarize: bool = False
-    deskew: bool = True
+    denoise: bool = settings.PREPROCESS_DENOISE
+    binarize: bool = settings.PREPROCESS_BINARIZE
+    deskew: bool = settings.PREPROCESS_DESKEW
     dpi: int = 300
     pages: Optional[List[int]] = None  # 1-based 指定页码
     ignore_top: int = 0      # 忽略顶部百分比 (0-100)
@@ -53,9 +62,23 @@ class OCRStatusResponse(BaseModel):
     current_page: int
     total_pages: int
     message: str
+    effective_options: Optional[Dict] = None  # 实际生效的预处理参数
     result: Optional[Dict] = None
 
 
+class OCREngineInfo(BaseModel):
+    """OCR 引擎信息"""
+    kind: str
+    ignored_options: List[str]  # 对当前引擎不生效的预处理选项
+
+
+def _ignored_options() -> List[str]:
+    """神经网络引擎自行提取特征，去噪/二值化只增加耗时，按配置忽略"""
+    if settings.PREPROCESS_SKIP_FOR_NEURAL and OCREngine.builtin_preprocess:
+        return ["denoise", "binarize"]
+    return []
+
+
 def _normalize_pages(pages: Optional[List[int]], page_count: int) -> List[int]:
     if not pages:
         return list(range(page_count))
@@ -70,27 +93,47 @@ def process_ocr_task(
     pdf_path: Path,
     options: OCRRequest
 ):
-    """执行 OCR 后台任务"""
+    """执行 OCR 后台任务（在后台线程中运行独立的事件循环）"""
+    async def run():
+        try:
+            await _process_ocr_task(task_id, pdf_path, options)
+        finally:
+            # Redis 客户端绑定本次任务的事件循环，循环结束前关闭连接
+            await task_store.aclose()
+
+    asyncio.run(run())
+
+
+async def _process_ocr_task(
+    task_id: str,
+    pdf_path: Path,
+    options: OCRRequest
+):
+    """执行 OCR 任务：多页并发识别"""
     try:
         # 初始化状态
-        task_status[task_id] = {
-            "status": "processing",
-            "progress": 0,
-            "current_page": 0,
-            "total_pages": 0,
-            "message": "正在初始化...",
-            "result": None
-        }
+        await task_store.set_status(
+            task_id,
+            status="processing",
+            progress=0,
+            current_page=0,
+            total_pages=0,
+            message="正在初始化...",
+            effective_options=None,
+            result=None
+        )
 
-        # 检测 PDF 类型
-        detector = PDFDetector()
-        pdf_info = detector.detect(pdf_path)
+        # 检测 PDF 类型（上传时已检测过的结果直接复用）
+        pdf_info = await asyncio.to_thread(get_task_pdf_info, task_id, pdf_path)
 
         # 标准化页码（1-based）
         target_pages = _normalize_pages(options.pages, pdf_info.page_count)
 
-        task_status[task_id]["total_pages"] = len(target_pages)
-        task_status[task_id]["message"] = f"PDF 类型: {pdf_info.pdf_type}"
+        await task_store.set_status(
+            task_id,
+            total_pages=len(target_pages),
+            message=f"PDF 类型: {pdf_info.pdf_type}"
+        )
         write_task_meta(
             task_id,
             {
@@ -103,7 +146,7 @@ def process_ocr_task(
 
         # 初始化处理器
         renderer = PDFRenderer(dpi=options.dpi)
-        ocr_engine = OCREngine()
+        ocr_engine = get_engine()
         post_processor = PostProcessor()
         
         # 应用边距过滤设置
@@ -113,16 +156,12 @@ def process_ocr_task(
         post_processor.ignore_right = options.ignore_right
 
         ocr_results = []
-        processed_pages = []  # 记录处理后的页面对象，用于批量后处理
 
         # 纯文字 PDF 直接提取文本，无需 OCR
         if pdf_info.pdf_type == "text":
-            task_status[task_id]["message"] = "纯文字 PDF，直接提取文本..."
-            for idx, page_num in enumerate(target_pages):
-                task_status[task_id]["current_page"] = idx + 1
-                task_status[task_id]["message"] = f"正在提取第 {idx + 1}/{len(target_pages)} 页..."
-                task_status[task_id]["progress"] = (idx / max(len(target_pages), 1)) * 100
-                text = detector.extract_text(pdf_path, page_num)
+            await task_store.set_status(task_id, message="纯文字 PDF，直接提取文本...")
+            texts = await extract_text_batch_async(pdf_path, target_pages)
+            for page_num, text in zip(target_pages, texts):
                 ocr_results.append(
                     {
                         "page": page_num,
@@ -131,24 +170,27 @@ def process_ocr_task(
                         "method": "extract"
                     }
                 )
+            await task_store.set_status(task_id, current_page=len(target_pages))
 
             output_dir = file_manager.get_task_output_dir(task_id)
             result_file = output_dir / "ocr_result.json"
-            with open(result_file, "w", encoding="utf-8") as f:
-                json.dump(ocr_results, f, ensure_ascii=False, indent=2)
+            await awrite_json(result_file, ocr_results, indent=True)
 
             combined = "\n\n".join([item.get("text", "") for item in ocr_results])
-            task_status[task_id]["status"] = "completed"
-            task_status[task_id]["progress"] = 100
-            task_status[task_id]["message"] = "OCR 处理完成"
-            task_status[task_id]["result"] = {
-                "type": "text",
-                "content": combined,
-                "pages": [
-                    {"page": item["page"], "text": item["text"], "confidence": 1.0}
-                    for item in ocr_results
-                ]
-            }
+            await task_store.set_status(
+                task_id,
+                status="completed",
+                progress=100,
+                message="OCR 处理完成",
+                result={
+                    "type": "text",
+                    "content": combined,
+                    "pages": [
+                        {"page": item["page"], "text": item["text"], "confidence": 1.0}
+                        for item in ocr_results
+                    ]
+                }
+            )
             write_task_meta(
                 task_id,
                 {
@@ -161,140 +203,147 @@ def process_ocr_task(
             return
 
         # 图片型/混合型 PDF 需要 OCR
-        # 图片型/混合型 PDF 需要 OCR
-        
-        from concurrent.futures import ThreadPoolExecutor
-        import queue
+        # 渲染与预处理在进程池中按页序预取，多页的 OCR 与后处理并发进行
+        image_pages = pdf_info.image_page_set
+        ocr_pages = [p for p in target_pages if p in image_pages]
+        # 纯文本页只打开一次文档批量提取，与 OCR 并行进行
+        text_targets = [p for p in target_pages if p not in image_pages]
+        extracted = None
+        if text_targets:
+            extracted = asyncio.ensure_future(extract_text_batch_async(pdf_path, text_targets))
+        ignored = _ignored_options()
+        preprocess_opts = {
+            "dpi": renderer.dpi,
+            "preprocess": options.preprocess,
+            "denoise": options.denoise and "denoise" not in ignored,
+            "deskew": options.deskew,
+            "binarize": options.binarize and "binarize" not in ignored,
+        }
+        # 被引擎忽略的选项对调用方可见
+        await task_store.set_status(task_id, effective_options=preprocess_opts)
+        # 最后几页处理完后让子进程关闭文档，不在任务结束后继续占用文件句柄
+        close_from = len(ocr_pages) - PREPROCESS_WORKERS
+        close_opts = {**preprocess_opts, "close_after": True}
+        jobs = (
+            (str(pdf_path), p_num, close_opts if i >= close_from else preprocess_opts)
+            for i, p_num in enumerate(ocr_pages)
+        )
 
-        # 定义预处理函数 (CPU 密集型)
-        def preprocess_page(p_num):
-            try:
-                # 渲染
-                rend = renderer.render_page(pdf_path, p_num)
-                img = rend.image
-                # 预处理
-                if options.preprocess:
-                    if options.denoise:
-                        img = denoise(img, method="gaussian")
-                    if options.deskew:
-                        img, _ = deskew(img)
-                    if options.binarize:
-                        img = binarize(img, method="otsu")
-                return p_num, img, None
-            except Exception as ex:
-                return p_num, None, ex
-
-        # 使用线程池进行预取 (Pre-fetching)
-        # 限制最大并发数为 3，避免内存爆炸
-        max_workers = 3
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 初始化任务队列
-            future_dict = {}
-            # 先提交前几个任务
-            for i in range(min(max_workers, len(target_pages))):
-                p_num = target_pages[i]
-                future_dict[p_num] = executor.submit(preprocess_page, p_num)
-            
-            next_submit_idx = max_workers
-
-            for idx, page_num in enumerate(target_pages):
-                task_status[task_id]["current_page"] = idx + 1
-                task_status[task_id]["message"] = f"正在识别第 {idx + 1}/{len(target_pages)} 页..."
-                task_status[task_id]["progress"] = (idx / max(len(target_pages), 1)) * 100
-
-                # 判断不需要 OCR 的情况
-                need_ocr = page_num in pdf_info.image_pages
-                if not need_ocr:
-                    # 纯文本页直接提取
-                    text = detector.extract_text(pdf_path, page_num)
-                    ocr_results.append({
-                        "page": page_num,
-                        "text": text,
-                        "confidence": 1.0,
-                        "method": "extract"
-                    })
-                    # 如果该页原本在任务队列里（虽然不太可能，逻辑上分开的），需要清理
-                    if page_num in future_dict:
-                        future_dict[page_num].cancel()
-                        del future_dict[page_num]
-                    
-                    # 提交下一个任务以保持流水线满载
-                    if next_submit_idx < len(target_pages):
-                        next_p = target_pages[next_submit_idx]
-                        future_dict[next_p] = executor.submit(preprocess_page, next_p)
-                        next_submit_idx += 1
-                    continue
+        sem = asyncio.Semaphore(max(settings.OCR_CONCURRENCY, 1))
+        progress_lock = asyncio.Lock()
+        done_count = 0
+        total = len(target_pages)
+        # 页码 -> (结果, 后处理页面对象或 None)
+        page_outputs: Dict[int, tuple] = {}
+
+        async def mark_done(count: int = 1):
+            nonlocal done_count
+            async with progress_lock:
+                done_count += count
+                await task_store.set_status(
+                    task_id,
+                    current_page=done_count,
+                    message=f"已识别 {done_count}/{total} 页...",
+                    progress=(done_count / max(total, 1)) * 100
+                )
 
-                # 获取预处理结果
-                if page_num not in future_dict:
-                     # 如果还没提交（逻辑上不应发生，除非 worker 极少），现在提交
-                     future_dict[page_num] = executor.submit(preprocess_page, page_num)
-                
-                # 等待当前页的预处理完成
-                _, image, error = future_dict[page_num].result()
-                del future_dict[page_num] # 释放引用
-                
-                # 立即提交下一个任务，保持 pipeline 流动
-                if next_submit_idx < len(target_pages):
-                    next_p = target_pages[next_submit_idx]
-                    future_dict[next_p] = executor.submit(preprocess_page, next_p)
-                    next_submit_idx += 1
-
-                if error:
+        async def ocr_one(page_num: int, image):
+            """识别单页（调用前已占用一个并发名额）"""
+            try:
+                # OCR 识别（推理在引擎内串行，结果解析与后处理可并发）
+                ocr_result = await ocr_engine.recognize_async(image, page_num)
+                del image
+                processed = await asyncio.to_thread(post_processor.process, ocr_result)
+            finally:
+                sem.release()
+
+            page_outputs[page_num] = ({
+                "page": page_num,
+                "text": processed.text,
+                "confidence": ocr_result.avg_confidence,
+                "paragraphs": [p.text for p in processed.paragraphs],
+                "method": "ocr"
+            }, processed)
+            await mark_done()
+
+        await task_store.set_status(task_id, message=f"正在识别 {total} 页...")
+        # 预取窗口：最多保留 2 倍进程数的未完成任务，限制内存占用
+        prefetcher = prefetch(
+            get_preprocess_pool(), preprocess_page, jobs,
+            2 * PREPROCESS_WORKERS, on_abandon=discard_future_image
+        )
+        ocr_tasks = []
+        try:
+            for (_, page_num, _), future in prefetcher:
+                try:
+                    image = load_shared_image(await asyncio.wrap_future(future))
+                except Exception as error:
                     print(f"预处理失败 (Page {page_num}): {error}")
                     # 降级处理或者跳过
-                    ocr_results.append({
+                    page_outputs[page_num] = ({
                         "page": page_num,
                         "text": "",
                         "confidence": 0.0,
                         "error": str(error)
-                    })
+                    }, None)
+                    await mark_done()
                     continue
 
-                # OCR 识别 (GPU Bound - Main Thread)
-                ocr_result = ocr_engine.recognize(image, page_num)
-
-                # 后处理 (CPU Bound - 可以异步但这里简单的先串行)
-                processed = post_processor.process(ocr_result)
-                processed_pages.append(processed)
-
-                ocr_results.append(
-                    {
-                        "page": page_num,
-                        "text": processed.text,
-                        "confidence": ocr_result.avg_confidence,
-                        "paragraphs": [p.text for p in processed.paragraphs],
-                        "method": "ocr"
-                    }
-                )
+                # 并发名额占满时在此等待，预取随之暂停
+                await sem.acquire()
+                ocr_tasks.append(asyncio.create_task(ocr_one(page_num, image)))
+                del image
+
+            await asyncio.gather(*ocr_tasks)
+        finally:
+            # 任务中途失败时，取消未开始的预处理并释放其共享内存
+            prefetcher.close()
+
+        if extracted is not None:
+            for page_num, text in zip(text_targets, await extracted):
+                page_outputs[page_num] = ({
+                    "page": page_num,
+                    "text": text,
+                    "confidence": 1.0,
+                    "method": "extract"
+                }, None)
+            await mark_done(len(text_targets))
+
+        # 按页码顺序整理结果
+        ordered = [page_outputs[p] for p in target_pages]
+        ocr_results = [entry for entry, _ in ordered]
+        # 记录处理后的页面对象及其对应结果，用于批量后处理
+        ocr_entries = [entry for entry, page in ordered if page is not None]
+        processed_pages = [page for _, page in ordered if page is not None]
 
         # 批量后处理：移除重复的页眉页脚
         if settings.REMOVE_HEADER_FOOTER and processed_pages:
             final_pages = post_processor._remove_headers_footers(processed_pages)
             # 同步回 ocr_results
-            for idx, page in enumerate(final_pages):
-                if idx < len(ocr_results):
-                    ocr_results[idx]["text"] = page.text
-                    ocr_results[idx]["paragraphs"] = [p.text for p in page.paragraphs]
-                    if page.header:
-                        ocr_results[idx]["header"] = page.header
-                    if page.footer:
-                        ocr_results[idx]["footer"] = page.footer
+            for entry, page in zip(ocr_entries, final_pages):
+                entry["text"] = page.text
+                entry["paragraphs"] = [p.text for p in page.paragraphs]
+                if page.header:
+                    entry["header"] = page.header
+                if page.footer:
+                    entry["footer"] = page.footer
 
         # 保存结果
         output_dir = file_manager.get_task_output_dir(task_id)
         result_file = output_dir / "ocr_result.json"
-        with open(result_file, "w", encoding="utf-8") as f:
-            json.dump(ocr_results, f, ensure_ascii=False, indent=2)
+        await awrite_json(result_file, ocr_results, indent=True)
 
         # 更新状态
-        task_status[task_id]["status"] = "completed"
-        task_status[task_id]["progress"] = 100
-        task_status[task_id]["message"] = "OCR 处理完成"
-        task_status[task_id]["result"] = {
-            "type": "ocr",
-            "pages": ocr_results
-        }
+        await task_store.set_status(
+            task_id,
+            status="completed",
+            progress=100,
+            message="OCR 处理完成",
+            result={
+                "type": "ocr",
+                "pages": ocr_results
+            }
+        )
         write_task_meta(
             task_id,
             {
@@ -306,8 +355,11 @@ def process_ocr_task(
         )
 
     except Exception as e:
-        task_status[task_id]["status"] = "failed"
-        task_status[task_id]["message"] = f"处理失败: {str(e)}"
+        await task_store.set_status(
+            task_id,
+            status="failed",
+            message=f"处理失败: {str(e)}"
+        )
         write_task_meta(
             task_id,
             {
@@ -328,7 +380,7 @@ async def start_ocr(
     启动 OCR 任务
     """
     # 检查任务是否存在
-    files = file_manager.list_task_files(task_id)
+    files = await asyncio.to_thread(file_manager.list_task_files, task_id)
     if not files["uploads"]:
         raise HTTPException(status_code=404, detail="任务不存在")
 
@@ -337,9 +389,23 @@ async def start_ocr(
     pdf_path = file_manager.get_task_upload_dir(task_id) / pdf_filename
 
     # 检查是否正在处理中
-    if task_id in task_status and task_status[task_id]["status"] == "processing":
+    status = await task_store.get_status(task_id)
+    if status and status["status"] == "processing":
         raise HTTPException(status_code=400, detail="任务正在处理中")
 
+    # 后台任务在响应发出后才开始运行；先重置状态，
+    # 避免重新识别时订阅方读到上一次的 completed 状态和结果
+    await task_store.set_status(
+        task_id,
+        status="pending",
+        progress=0,
+        current_page=0,
+        total_pages=0,
+        message="等待处理",
+        effective_options=None,
+        result=None
+    )
+
     # 添加后台任务
     background_tasks.add_task(process_ocr_task, task_id, pdf_path, options)
 
@@ -350,14 +416,47 @@ async def start_ocr(
     )
 
 
-@router.get("/{task_id}/status", response_model=OCRStatusResponse)
+# SSE 推送的状态字段（结果体积大，完成后通过 /result 获取）
+_EVENT_FIELDS = ("status", "progress", "current_page", "total_pages", "message", "effective_options")
+
+
+@router.get("/engine", response_model=OCREngineInfo)
+async def get_engine_info():
+    """
+    获取 OCR 引擎信息
+
+    前端据此隐藏对当前引擎不生效的预处理选项（不加载模型）
+    """
+    return OCREngineInfo(kind=OCREngine.kind, ignored_options=_ignored_options())
+
+
+@router.get("/{task_id}/events")
+async def stream_ocr_events(task_id: str):
+    """
+    以 Server-Sent Events 推送 OCR 任务进度
+
+    仅在状态变化时推送，任务完成或失败后结束
+    """
+    files = await asyncio.to_thread(file_manager.list_task_files, task_id)
+    if not files["uploads"]:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    return status_event_response(
+        task_store, task_id, _EVENT_FIELDS,
+        default={"status": "pending", "progress": 0, "current_page": 0,
+                 "total_pages": 0, "message": "等待处理"}
+    )
+
+
+@router.get("/{task_id}/status", response_model=OCRStatusResponse, deprecated=True)
 async def get_ocr_status(task_id: str):
     """
-    查询 OCR 任务状态
+    查询 OCR 任务状态（轮询方式，建议改用 /events）
     """
-    if task_id not in task_status:
+    status = await task_store.get_status(task_id)
+    if status is None:
         # 检查任务是否存在
-        files = file_manager.list_task_files(task_id)
+        files = await asyncio.to_thread(file_manager.list_task_files, task_id)
         if not files["uploads"]:
             raise HTTPException(status_code=404, detail="任务不存在")
 
@@ -370,7 +469,6 @@ async def get_ocr_status(task_id: str):
             message="等待处理"
         )
 
-    status = task_status[task_id]
     return OCRStatusResponse(
         task_id=task_id,
         status=status["status"],
@@ -378,6 +476,7 @@ async def get_ocr_status(task_id: str):
         current_page=status["current_page"],
         total_pages=status["total_pages"],
         message=status["message"],
+        effective_options=status.get("effective_options"),
         result=status.get("result")
     )
 
@@ -385,12 +484,12 @@ async def get_ocr_status(task_id: str):
 @router.get("/{task_id}/result")
 async def get_ocr_result(task_id: str):
     """获取 OCR 结果"""
-    if task_id not in task_status:
+    status = await task_store.get_status(task_id)
+    if status is None:
         raise HTTPException(status_code=404, detail="任务不存在")
 
-    status = task_status[task_id]
-
     if status["status"] != "completed":
         raise HTTPException(status_code=400, detail="OCR 尚未完成")
 
-    return status["result"]
+    # 直接返回响应，跳过 jsonable_encoder 对大结果的逐项遍历
+    return ORJSONResponse(status["result"])
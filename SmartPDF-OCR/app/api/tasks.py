@@ -5,8 +5,10 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
 
 from app.core.file_manager import file_manager
+from app.core.history_index import remove_index_entries
 
 router = APIRouter(prefix="/tasks", tags=["任务管理"])
 
@@ -29,7 +31,7 @@ async def get_task_info(task_id: str):
     """
     获取任务信息
     """
-    files = file_manager.list_task_files(task_id)
+    files = await asyncio.to_thread(file_manager.list_task_files, task_id)
     
     if not files["uploads"] and not files["outputs"]:
         raise HTTPException(status_code=404, detail="任务不存在")
@@ -46,12 +48,13 @@ async def delete_task(task_id: str):
     """
     删除任务
     """
-    files = file_manager.list_task_files(task_id)
+    files = await asyncio.to_thread(file_manager.list_task_files, task_id)
     
     if not files["uploads"] and not files["outputs"]:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    file_manager.cleanup_task(task_id)
+    await asyncio.to_thread(file_manager.cleanup_task, task_id)
+    await asyncio.to_thread(remove_index_entries, [task_id])
     
     return {"message": "任务已删除", "task_id": task_id}
 
@@ -64,7 +67,7 @@ async def cleanup_old_tasks(max_age_hours: int = 24):
     if max_age_hours < 1:
         raise HTTPException(status_code=400, detail="max_age_hours 必须大于 0")
     
-    cleaned = file_manager.cleanup_old_files(max_age_hours)
+    cleaned = await asyncio.to_thread(file_manager.cleanup_old_files, max_age_hours)
     
     return CleanupResponse(
         cleaned_count=cleaned,
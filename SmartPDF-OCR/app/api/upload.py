@@ -2,20 +2,25 @@
 文件上传 API
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Query
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional
 from datetime import datetime
-import threading
+import asyncio
 
 from app.core.file_manager import file_manager
-from app.core.pdf_detector import get_pdf_info, PDFInfo
-from app.core.history_index import write_task_meta
+from app.core.pdf_detector import get_task_pdf_info_async, PDFInfo
+from app.core.history_index import write_task_meta, read_task_meta
+from app.core.task_store import TaskStore
+from app.utils.sse import status_event_response
 
 router = APIRouter(prefix="/upload", tags=["上传"])
 
 # 解析状态存储
-parse_status: Dict[str, Dict[str, Any]] = {}
+parse_store = TaskStore(prefix="parse")
+
+# SSE 推送的解析状态字段
+_PARSE_EVENT_FIELDS = ("status", "message", "progress", "pdf_type", "page_count")
 
 
 class UploadResponse(BaseModel):
@@ -37,30 +42,36 @@ class ParseStatusResponse(BaseModel):
     progress: float = 0
 
 
-def _parse_pdf_background(task_id: str, file_path: str, filename: str, file_size: int):
-    """后台解析 PDF（在线程池中执行）"""
+async def _parse_pdf_background(
+    task_id: str, file_path: str, filename: str, file_size: int, file_hash: str
+):
+    """后台解析 PDF（解析在进程池中执行）"""
     try:
-        parse_status[task_id] = {
-            "status": "parsing",
-            "message": "正在分析 PDF 结构...",
-            "progress": 10
-        }
+        await parse_store.set_status(
+            task_id,
+            status="parsing",
+            message="正在分析 PDF 结构...",
+            progress=10
+        )
         
-        pdf_info = get_pdf_info(file_path)
+        pdf_info = await get_task_pdf_info_async(task_id, file_path, file_hash)
         
-        parse_status[task_id] = {
-            "status": "ready",
-            "message": "解析完成",
-            "progress": 100,
-            "pdf_type": pdf_info.pdf_type,
-            "page_count": pdf_info.page_count
-        }
+        await parse_store.set_status(
+            task_id,
+            status="ready",
+            message="解析完成",
+            progress=100,
+            pdf_type=pdf_info.pdf_type,
+            page_count=pdf_info.page_count
+        )
         
-        write_task_meta(
+        await asyncio.to_thread(
+            write_task_meta,
             task_id,
             {
                 "filename": filename,
                 "file_size": file_size,
+                "file_hash": file_hash,
                 "pdf_type": pdf_info.pdf_type,
                 "page_count": pdf_info.page_count,
                 "status": "ready",
@@ -69,12 +80,14 @@ def _parse_pdf_background(task_id: str, file_path: str, filename: str, file_size
         )
         
     except Exception as e:
-        parse_status[task_id] = {
-            "status": "failed",
-            "message": f"解析失败: {str(e)}",
-            "progress": 0
-        }
-        write_task_meta(
+        await parse_store.set_status(
+            task_id,
+            status="failed",
+            message=f"解析失败: {str(e)}",
+            progress=0
+        )
+        await asyncio.to_thread(
+            write_task_meta,
             task_id,
             {
                 "status": "failed",
@@ -84,13 +97,13 @@ def _parse_pdf_background(task_id: str, file_path: str, filename: str, file_size
 
 
 @router.post("", response_model=UploadResponse)
-async def upload_pdf(file: UploadFile = File(...)):
+async def upload_pdf(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """
     上传 PDF 文件（异步模式）
     
     - 上传后立即返回任务 ID
     - PDF 解析在后台执行
-    - 通过 /upload/{task_id}/parse-status 轮询解析状态
+    - 通过 /upload/{task_id}/parse-status/stream 订阅解析状态
     """
     # 检查文件类型
     if not file.filename.lower().endswith('.pdf'):
@@ -99,56 +112,63 @@ async def upload_pdf(file: UploadFile = File(...)):
     # 生成任务 ID
     task_id = file_manager.generate_task_id(file.filename)
     
-    # 读取文件内容
-    content = await file.read()
-    
-    # 检查文件大小
-    if len(content) > file_manager.max_upload_size:
-        max_mb = file_manager.max_upload_size / (1024 * 1024)
-        raise HTTPException(
-            status_code=400, 
-            detail=f"文件过大，最大支持 {max_mb:.0f}MB"
+    # 分块写入磁盘，同时校验 PDF 文件头与大小上限（磁盘 IO 放到线程中，不阻塞事件循环）
+    try:
+        file_path, file_size, file_hash = await asyncio.to_thread(
+            file_manager.save_upload_file, file.file, file.filename, task_id
         )
+    except ValueError as e:
+        await asyncio.to_thread(file_manager.cleanup_task, task_id)
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # 保存文件
-    file_path = file_manager.save_upload_file(content, file.filename, task_id)
-    
-    # 校验 PDF
-    is_valid, error = file_manager.validate_pdf(file_path)
+    # 文件头正确但已损坏或加密的 PDF 在这里拒绝，而不是到后台解析时才失败
+    is_valid, error = await asyncio.to_thread(file_manager.validate_pdf, file_path)
     if not is_valid:
-        file_manager.cleanup_task(task_id)
+        await asyncio.to_thread(file_manager.cleanup_task, task_id)
         raise HTTPException(status_code=400, detail=error)
     
     # 初始化解析状态
-    parse_status[task_id] = {
-        "status": "parsing",
-        "message": "已接收文件，正在排队解析...",
-        "progress": 0
-    }
+    await parse_store.set_status(
+        task_id,
+        status="parsing",
+        message="已接收文件，正在排队解析...",
+        progress=0
+    )
     
-    # 后台线程解析 PDF
-    thread = threading.Thread(
-        target=_parse_pdf_background,
-        args=(task_id, str(file_path), file.filename, len(content))
+    # 后台解析 PDF（响应返回后执行）
+    background_tasks.add_task(
+        _parse_pdf_background, task_id, str(file_path), file.filename, file_size, file_hash
     )
-    thread.start()
     
     return UploadResponse(
         task_id=task_id,
         filename=file.filename,
-        file_size=len(content),
+        file_size=file_size,
         message="文件已上传，正在解析中...",
         status="parsing"
     )
 
 
 @router.get("/{task_id}/parse-status", response_model=ParseStatusResponse)
-async def get_parse_status(task_id: str):
+async def get_parse_status(
+    task_id: str,
+    wait: float = Query(0, ge=0, le=30, description="解析中时最多等待状态变化的秒数（长轮询）")
+):
     """获取 PDF 解析状态"""
-    if task_id not in parse_status:
+    status = await parse_store.get_status(task_id)
+    if status is not None and status["status"] == "parsing" and wait > 0:
+        with parse_store.subscribe(task_id) as changed:
+            # 订阅后重新读取，避免错过订阅前发生的变化
+            status = await parse_store.get_status(task_id) or status
+            if status["status"] == "parsing":
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                status = await parse_store.get_status(task_id) or status
+    if status is None:
         # 尝试从 meta 文件读取
-        from app.core.history_index import read_task_meta
-        meta = read_task_meta(task_id)
+        meta = await asyncio.to_thread(read_task_meta, task_id)
         if meta and meta.get("status") == "ready":
             return ParseStatusResponse(
                 task_id=task_id,
@@ -167,7 +187,6 @@ async def get_parse_status(task_id: str):
             )
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    status = parse_status[task_id]
     return ParseStatusResponse(
         task_id=task_id,
         status=status["status"],
@@ -178,10 +197,38 @@ async def get_parse_status(task_id: str):
     )
 
 
+@router.get("/{task_id}/parse-status/stream")
+async def stream_parse_status(task_id: str):
+    """
+    以 Server-Sent Events 推送 PDF 解析状态
+
+    解析完成或失败后结束；/parse-status 保留为轮询兜底
+    """
+    default = {"status": "parsing", "message": "", "progress": 0}
+    if await parse_store.get_status(task_id) is None:
+        # 解析状态已过期或服务重启过，推送 meta 中记录的最终状态
+        meta = await asyncio.to_thread(read_task_meta, task_id)
+        if meta and meta.get("status") == "ready":
+            default = {
+                "status": "ready", "message": "解析完成", "progress": 100,
+                "pdf_type": meta.get("pdf_type"), "page_count": meta.get("page_count")
+            }
+        elif meta and meta.get("status") == "failed":
+            default = {"status": "failed", "message": meta.get("error", "解析失败"), "progress": 0}
+        else:
+            raise HTTPException(status_code=404, detail="任务不存在")
+
+    return status_event_response(
+        parse_store, task_id, _PARSE_EVENT_FIELDS,
+        default=default,
+        terminal=("ready", "failed")
+    )
+
+
 @router.get("/{task_id}/info")
 async def get_upload_info(task_id: str):
     """获取上传文件信息"""
-    files = file_manager.list_task_files(task_id)
+    files = await asyncio.to_thread(file_manager.list_task_files, task_id)
     
     if not files["uploads"]:
         raise HTTPException(status_code=404, detail="任务不存在")
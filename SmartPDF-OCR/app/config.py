@@ -7,7 +7,7 @@ import os
 from pathlib import Path
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import Literal, Optional
+from typing import Literal, Optional, List, Tuple
 
 
 def is_frozen() -> bool:
@@ -57,20 +57,29 @@ class Settings(BaseSettings):
     DEFAULT_DPI: int = 300  # 默认渲染 DPI
     MAX_DPI: int = 600  # 最大 DPI
     MIN_DPI: int = 150  # 最小 DPI
+    PDF_RENDER_BACKEND: Literal["mupdf", "pdfium"] = "mupdf"  # 渲染后端：pdfium 需安装 pypdfium2
     
     # OCR 配置
     OCR_LANG: str = "ch"  # OCR 语言：ch=中文, en=英文
     OCR_USE_ANGLE_CLS: bool = True  # 是否启用方向检测
     OCR_USE_GPU: bool = True  # 是否使用 GPU
     OCR_USE_TENSORRT: bool = True  # 是否使用 TensorRT 加速 (需要 GPU)
+    OCR_PRECISION: Literal["fp32", "fp16", "int8"] = "fp16"  # TensorRT 推理精度（int8 需使用量化模型）
+    OCR_ENABLE_MKLDNN: bool = True  # CPU 模式下是否启用 MKL-DNN 加速
+    OCR_CPU_THREADS: int = Field(default_factory=lambda: os.cpu_count() or 1)  # CPU 推理线程数
     OCR_CONFIDENCE_THRESHOLD: float = 0.5  # 置信度阈值
     OCR_WARMUP: bool = True  # 是否在启动时进行预热
+    OCR_WARMUP_SHAPES: List[Tuple[int, int]] = [(320, 240), (1280, 960), (2480, 3508)]  # 预热图片尺寸（宽, 高），含 300 DPI A4
+    OCR_CONCURRENCY: int = Field(default_factory=lambda: min(os.cpu_count() or 1, 4))  # 同时处理的页面数（内存/吞吐调节项：每页占一张整页图像，推理仍串行）
+    OCR_BATCH_SIZE: int = 4  # 合并为一次推理的最大页数
+    OCR_REC_BATCH_NUM: int = 32  # 识别网络单批处理的文本行数（PaddleOCR 默认 6）
     
     # 图像预处理配置
     PREPROCESS_DENOISE: bool = True  # 是否启用去噪
     PREPROCESS_BINARIZE: bool = False  # 是否启用二值化（对扫描件有效）
     PREPROCESS_DESKEW: bool = True  # 是否启用倾斜校正
     BINARIZE_THRESHOLD: int = 127  # 二值化阈值
+    PREPROCESS_SKIP_FOR_NEURAL: bool = True  # 神经网络 OCR 引擎时跳过去噪/二值化，只保留纠偏
     
     # 后处理配置
     PARAGRAPH_LINE_SPACING_THRESHOLD: float = 1.5  # 段落行间距阈值倍数
@@ -85,6 +94,8 @@ class Settings(BaseSettings):
     API_HOST: str = "127.0.0.1"  # 修改为 localhost，更安全
     API_PORT: int = 8000
     MAX_UPLOAD_SIZE: int = 100 * 1024 * 1024  # 100MB
+    REDIS_URL: str = ""  # 任务状态存储，如 redis://localhost:6379/0；为空时保存在进程内
+    TASK_STATUS_TTL: int = 86400  # 任务状态保留时间（秒）
     
     # Gradio 配置
     GRADIO_HOST: str = "0.0.0.0"
@@ -96,6 +107,9 @@ class Settings(BaseSettings):
     AI_API_KEY: str = ""  # 通过环境变量或 .env 文件设置
     AI_MODEL: str = "gemini-2.0-flash"
     AI_MAX_CHUNK_CHARS: int = 2000  # 每段最大字符数
+    AI_MAX_CONCURRENCY: int = 8  # 同时进行的 AI 请求上限
+    AI_BATCH_SIZE: int = 8  # Gemini 单次请求合并的分块数（1 表示不合并）
+    AI_MAX_RETRIES: int = 3  # 遇到 429/5xx 时的最大重试次数
     
     def model_post_init(self, __context):
         """初始化后处理"""
@@ -4,15 +4,35 @@
 """
 
 import os
+import time
 import uuid
 import shutil
 from pathlib import Path
-from datetime import datetime, timedelta
-from typing import Optional, Tuple
+from datetime import datetime
+from typing import Optional, Tuple, BinaryIO
+from functools import lru_cache
 import hashlib
+import fitz  # PyMuPDF
 
 from app.config import settings
 
+try:
+    # 可选：BLAKE3 使用 SIMD 与多线程，比 MD5 快数倍
+    from blake3 import blake3 as _blake3
+except ImportError:
+    _blake3 = None
+
+
+def _new_hasher():
+    """创建文件哈希对象：优先 BLAKE3，未安装时回退到 MD5"""
+    if _blake3 is not None:
+        return _blake3(max_threads=_blake3.AUTO)
+    return hashlib.md5()
+
+
+# 文件名中的不安全字符，一次 translate 全部替换为下划线
+_UNSAFE_FILENAME_CHARS = str.maketrans({c: "_" for c in '<>:"/\\|?*'})
+
 
 class FileManager:
     """文件管理器"""
@@ -25,6 +45,9 @@ class FileManager:
         # 确保目录存在
         self.upload_dir.mkdir(parents=True, exist_ok=True)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        
+        # 已确认存在的任务目录，避免每次获取路径都 mkdir（删除任务时移除）
+        self._ensured_dirs: set = set()
     
     def generate_task_id(self, filename: Optional[str] = None) -> str:
         """
@@ -45,17 +68,20 @@ class FileManager:
             suffix = "".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=4))
             return f"{now}_{suffix}"
     
+    def _ensure_dir(self, task_dir: Path) -> Path:
+        # 并发时可能重复 mkdir，exist_ok 下无害
+        if task_dir not in self._ensured_dirs:
+            task_dir.mkdir(parents=True, exist_ok=True)
+            self._ensured_dirs.add(task_dir)
+        return task_dir
+    
     def get_task_upload_dir(self, task_id: str) -> Path:
         """获取任务上传目录"""
-        task_dir = self.upload_dir / task_id
-        task_dir.mkdir(parents=True, exist_ok=True)
-        return task_dir
+        return self._ensure_dir(self.upload_dir / task_id)
     
     def get_task_output_dir(self, task_id: str) -> Path:
         """获取任务输出目录"""
-        task_dir = self.output_dir / task_id
-        task_dir.mkdir(parents=True, exist_ok=True)
-        return task_dir
+        return self._ensure_dir(self.output_dir / task_id)
     
     def validate_pdf(self, file_path: Path) -> Tuple[bool, str]:
         """
@@ -93,30 +119,67 @@ class FileManager:
         except Exception as e:
             return False, f"读取文件失败: {str(e)}"
         
+        # 检查文档结构（只读取 xref 与页面树，不解析页面内容）
+        try:
+            with fitz.open(file_path) as doc:
+                if doc.needs_pass:
+                    return False, "PDF 文件已加密，请先移除密码"
+                if doc.page_count == 0:
+                    return False, "PDF 文件不包含任何页面"
+        except Exception:
+            return False, "PDF 文件已损坏，无法解析"
+        
         return True, ""
     
-    def save_upload_file(self, file_content: bytes, filename: str, task_id: str) -> Path:
+    def save_upload_file(self, file_obj: BinaryIO, filename: str, task_id: str) -> Tuple[Path, int, str]:
         """
-        保存上传的文件
+        保存上传的文件（分块写入，不在内存中保留完整文件，同时计算哈希）
+        
+        写入前先检查首块的 PDF 文件头，写入过程中检查大小上限
         
         Args:
-            file_content: 文件内容
+            file_obj: 上传文件对象
             filename: 原始文件名
             task_id: 任务 ID
             
         Returns:
-            保存的文件路径
+            (保存的文件路径, 文件大小, 文件哈希)
+            
+        Raises:
+            ValueError: 文件为空、不是 PDF 或超过大小上限
         """
+        # SpooledTemporaryFile 在 3.11 之前不支持 readinto，按 1MB 分块读取
+        chunk = file_obj.read(1024 * 1024)
+        if not chunk:
+            raise ValueError("文件为空")
+        if not chunk.startswith(b"%PDF"):
+            raise ValueError("无效的 PDF 文件")
+        
         task_dir = self.get_task_upload_dir(task_id)
         
         # 使用原始文件名，但确保安全
         safe_filename = self._sanitize_filename(filename)
         file_path = task_dir / safe_filename
         
-        with open(file_path, "wb") as f:
-            f.write(file_content)
-        
-        return file_path
+        written = 0
+        file_hash = _new_hasher()
+        try:
+            with open(file_path, "wb") as f:
+                while chunk:
+                    written += len(chunk)
+                    if written > self.max_upload_size:
+                        max_mb = self.max_upload_size / (1024 * 1024)
+                        raise ValueError(f"文件过大，最大支持 {max_mb:.0f}MB")
+                    file_hash.update(chunk)
+                    f.write(chunk)
+                    chunk = file_obj.read(1024 * 1024)
+        except BaseException:
+            file_path.unlink(missing_ok=True)
+            raise
+        finally:
+            # mtime 精度较粗的文件系统上，同一时刻的增删可能不改变 mtime
+            _scan_task_dirs.cache_clear()
+        return file_path, written, file_hash.hexdigest()
     
     def _sanitize_filename(self, filename: str) -> str:
         """清理文件名，移除不安全字符"""
@@ -124,9 +187,7 @@ class FileManager:
         filename = os.path.basename(filename)
         
         # 替换不安全字符
-        unsafe_chars = ['<', '>', ':', '"', '/', '\\', '|', '?', '*']
-        for char in unsafe_chars:
-            filename = filename.replace(char, '_')
+        filename = filename.translate(_UNSAFE_FILENAME_CHARS)
         
         # 如果文件名为空，使用默认名称
         if not filename or filename == ".pdf":
@@ -135,22 +196,27 @@ class FileManager:
         return filename
     
     def get_file_hash(self, file_path: Path) -> str:
-        """计算文件 MD5 哈希"""
-        md5_hash = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(8192), b""):
-                md5_hash.update(chunk)
-        return md5_hash.hexdigest()
+        """计算文件哈希（BLAKE3，未安装时为 MD5），用作内容缓存键"""
+        file_hash = _new_hasher()
+        # 1MB 缓冲区复用读取，减少系统调用和临时 bytes 分配
+        buf = bytearray(1024 * 1024)
+        view = memoryview(buf)
+        with open(file_path, "rb", buffering=0) as f:
+            while n := f.readinto(buf):
+                file_hash.update(view[:n])
+        return file_hash.hexdigest()
     
     def cleanup_task(self, task_id: str) -> None:
         """清理任务相关文件"""
         # 清理上传目录
         upload_task_dir = self.upload_dir / task_id
+        self._ensured_dirs.discard(upload_task_dir)
         if upload_task_dir.exists():
             shutil.rmtree(upload_task_dir)
         
         # 清理输出目录
         output_task_dir = self.output_dir / task_id
+        self._ensured_dirs.discard(output_task_dir)
         if output_task_dir.exists():
             shutil.rmtree(output_task_dir)
     
@@ -164,41 +230,75 @@ class FileManager:
         Returns:
             清理的任务数量
         """
-        cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
+        # 直接比较时间戳，避免逐个目录转换为 datetime
+        cutoff_ts = time.time() - max_age_hours * 3600
         cleaned_count = 0
         
         for directory in [self.upload_dir, self.output_dir]:
             if not directory.exists():
                 continue
             
-            for task_dir in directory.iterdir():
-                if not task_dir.is_dir():
-                    continue
-                
-                # 检查目录修改时间
-                mtime = datetime.fromtimestamp(task_dir.stat().st_mtime)
-                if mtime < cutoff_time:
-                    shutil.rmtree(task_dir)
+            # scandir 的目录项自带类型信息，无需为每个条目单独 stat 判断是否为目录
+            with os.scandir(directory) as entries:
+                task_dirs = [e for e in entries if e.is_dir(follow_symlinks=False)]
+            
+            for task_dir in task_dirs:
+                # 检查目录修改时间（Windows 上直接取自目录项）
+                if task_dir.stat(follow_symlinks=False).st_mtime < cutoff_ts:
+                    self._ensured_dirs.discard(directory / task_dir.name)
+                    try:
+                        # 空目录直接 rmdir，无需 rmtree 遍历
+                        os.rmdir(task_dir.path)
+                    except OSError:
+                        shutil.rmtree(task_dir.path)
                     cleaned_count += 1
         
         return cleaned_count
     
     def list_task_files(self, task_id: str) -> dict:
-        """列出任务相关的所有文件"""
-        result = {
-            "uploads": [],
-            "outputs": []
-        }
+        """
+        列出任务相关的所有文件
         
+        结果按两个目录的修改时间缓存：目录内增删文件会改变其 mtime，
+        缓存随之失效，轮询时只需两次 stat 而不是完整遍历
+        """
         upload_dir = self.upload_dir / task_id
-        if upload_dir.exists():
-            result["uploads"] = [f.name for f in upload_dir.iterdir() if f.is_file()]
-        
         output_dir = self.output_dir / task_id
-        if output_dir.exists():
-            result["outputs"] = [f.name for f in output_dir.iterdir() if f.is_file()]
-        
-        return result
+        uploads, outputs = _scan_task_dirs(
+            str(upload_dir), _dir_mtime_ns(upload_dir),
+            str(output_dir), _dir_mtime_ns(output_dir)
+        )
+        return {
+            "uploads": list(uploads),
+            "outputs": list(outputs)
+        }
+
+
+def _dir_mtime_ns(path: Path) -> Optional[int]:
+    """目录修改时间，不存在时返回 None"""
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _list_dir_files(path: str, mtime_ns: Optional[int]) -> Tuple[str, ...]:
+    if mtime_ns is None:
+        return ()
+    with os.scandir(path) as entries:
+        return tuple(e.name for e in entries if e.is_file())
+
+
+@lru_cache(maxsize=4096)
+def _scan_task_dirs(
+    upload_dir: str, upload_mtime_ns: Optional[int],
+    output_dir: str, output_mtime_ns: Optional[int]
+) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """按 (目录, mtime) 缓存的目录扫描"""
+    return (
+        _list_dir_files(upload_dir, upload_mtime_ns),
+        _list_dir_files(output_dir, output_mtime_ns)
+    )
 
 
 # 全局文件管理器实例
@@ -1,41 +1,191 @@
 """
 历史记录索引
-维护每个任务的 meta.json，便于前端拉取历史列表
+维护每个任务的 meta.json，便于前端拉取历史列表；
+同时维护追加写入的 history_index.jsonl，历史列表无需遍历全部任务目录
 """
 
-import json
+import os
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Dict, Any, Optional, Iterable
+
+import orjson
 
 from app.core.file_manager import file_manager
 
+# 历史列表所需的字段（meta.json 中的其他内容不写入索引）
+_INDEX_FIELDS = (
+    "task_id", "filename", "file_size", "pdf_type", "page_count",
+    "status", "created_at", "updated_at"
+)
+
+_index_lock = threading.Lock()
+# meta.json 读-改-写在多个线程中进行（上传解析、OCR、AI），串行化避免丢失更新
+_meta_lock = threading.Lock()
+# 已读入内存的索引：task_id -> 条目，以及已读取到的文件偏移
+_index_entries: Dict[str, Dict[str, Any]] = {}
+_index_offset = 0
+_index_lines = 0
+
 
 def _meta_path(task_id: str) -> Path:
     output_dir = file_manager.get_task_output_dir(task_id)
     return output_dir / "meta.json"
 
 
+@lru_cache(maxsize=1024)
+def _load_meta(path: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+    """按 (路径, 修改时间, 大小) 缓存解析结果，文件变化后自动失效"""
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
 def read_task_meta(task_id: str) -> Optional[Dict[str, Any]]:
-    path = _meta_path(task_id)
-    if not path.exists():
+    # 只读不创建目录
+    path = file_manager.output_dir / task_id / "meta.json"
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
         return None
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    # 返回副本，调用方修改不影响缓存
+    return dict(_load_meta(str(path), stat.st_mtime_ns, stat.st_size))
 
 
 def write_task_meta(task_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
     path = _meta_path(task_id)
-    meta: Dict[str, Any] = {}
-    if path.exists():
-        with open(path, "r", encoding="utf-8") as f:
-            meta = json.load(f)
-    meta.update(data)
-    meta["task_id"] = task_id
-    now = datetime.utcnow().isoformat()
-    meta["updated_at"] = now
-    if "created_at" not in meta:
-        meta["created_at"] = now
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
+    with _meta_lock:
+        meta = read_task_meta(task_id) or {}
+        meta.update(data)
+        meta["task_id"] = task_id
+        now = datetime.utcnow().isoformat()
+        meta["updated_at"] = now
+        if "created_at" not in meta:
+            meta["created_at"] = now
+        # 先写临时文件再替换，写入中途崩溃不会留下损坏的 meta.json
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_bytes(orjson.dumps(meta, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        os.replace(tmp, path)
+        # mtime 精度较粗的文件系统上，快速连续写入可能不改变 (mtime, size)
+        _load_meta.cache_clear()
+    append_index_entry(task_id, meta)
     return meta
+
+
+def _index_path() -> Path:
+    return file_manager.output_dir / "history_index.jsonl"
+
+
+def _index_entry(task_id: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    entry = {k: meta[k] for k in _INDEX_FIELDS if k in meta}
+    entry["task_id"] = task_id
+    return entry
+
+
+def append_index_entry(task_id: str, meta: Dict[str, Any]) -> None:
+    """向历史索引追加一条记录（同一任务以最后一条为准）"""
+    line = orjson.dumps(_index_entry(task_id, meta)) + b"\n"
+    with _index_lock:
+        path = _index_path()
+        if not path.exists():
+            # 首次写入前先从现有任务目录建立完整索引
+            _rebuild_index_locked()
+        with open(path, "ab") as f:
+            f.write(line)
+
+
+def remove_index_entries(task_ids: Iterable[str]) -> None:
+    """向历史索引追加删除记录，读取时移除对应任务，压缩时不再保留"""
+    lines = b"".join(orjson.dumps({"task_id": t, "deleted": True}) + b"\n" for t in task_ids)
+    if not lines:
+        return
+    with _index_lock:
+        path = _index_path()
+        if not path.exists():
+            # 索引尚未建立，之后重建时按现有任务目录生成
+            return
+        with open(path, "ab") as f:
+            f.write(lines)
+
+
+def _rebuild_index_locked() -> None:
+    """扫描任务目录重建索引文件（仅在索引不存在时执行）"""
+    entries: Dict[str, Dict[str, Any]] = {}
+    task_ids = set()
+    for base in (file_manager.upload_dir, file_manager.output_dir):
+        if base.exists():
+            with os.scandir(base) as it:
+                task_ids.update(e.name for e in it if e.is_dir())
+
+    for task_id in task_ids:
+        meta = read_task_meta(task_id) or {}
+        entry = _index_entry(task_id, meta)
+        if not entry.get("updated_at"):
+            output_dir = file_manager.output_dir / task_id
+            if output_dir.exists():
+                entry["updated_at"] = datetime.fromtimestamp(output_dir.stat().st_mtime).isoformat()
+        entries[task_id] = entry
+
+    _write_index_locked(entries)
+
+
+def _write_index_locked(entries: Dict[str, Dict[str, Any]]) -> None:
+    global _index_offset, _index_lines
+    path = _index_path()
+    data = b"".join(orjson.dumps(e) + b"\n" for e in entries.values())
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+    _index_entries.clear()
+    _index_entries.update(entries)
+    _index_offset = len(data)
+    _index_lines = len(entries)
+
+
+def read_index() -> Dict[str, Dict[str, Any]]:
+    """
+    读取历史索引（增量读取新追加的行）
+    
+    Returns:
+        task_id -> 索引条目
+    """
+    global _index_offset, _index_lines
+    with _index_lock:
+        path = _index_path()
+        if not path.exists():
+            _rebuild_index_locked()
+            return dict(_index_entries)
+
+        size = path.stat().st_size
+        if size < _index_offset:
+            # 文件被其他进程压缩重写，从头读取
+            _index_entries.clear()
+            _index_offset = 0
+            _index_lines = 0
+
+        if size > _index_offset:
+            with open(path, "rb") as f:
+                f.seek(_index_offset)
+                chunk = f.read(size - _index_offset)
+            # 只处理完整的行，未写完的行留到下次
+            end = chunk.rfind(b"\n") + 1
+            for line in chunk[:end].splitlines():
+                if not line:
+                    continue
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue
+                if entry.get("deleted"):
+                    _index_entries.pop(entry["task_id"], None)
+                else:
+                    _index_entries[entry["task_id"]] = entry
+                _index_lines += 1
+            _index_offset += end
+
+        # 重复记录过多时压缩
+        if _index_lines > 2 * len(_index_entries) + 100:
+            _write_index_locked(dict(_index_entries))
+
+        return dict(_index_entries)
@@ -3,12 +3,17 @@ PDF 类型检测模块
 自动判断 PDF 是文字型还是图片型
 """
 
+import asyncio
+import threading
 from pathlib import Path
-from typing import Tuple, Literal
-from dataclasses import dataclass
-import pdfplumber
+from typing import Tuple, Literal, List, Optional, FrozenSet
+from dataclasses import dataclass, asdict, replace
+from collections import OrderedDict
+from functools import lru_cache, cached_property
+import fitz  # PyMuPDF
 
 from app.config import settings
+from app.core.history_index import read_task_meta, write_task_meta
 
 
 @dataclass
@@ -22,6 +27,11 @@ class PDFInfo:
     total_text_chars: int
     avg_chars_per_page: float
 
+    @cached_property
+    def image_page_set(self) -> FrozenSet[int]:
+        """图片型页面集合，用于 O(1) 判断页面是否需要 OCR"""
+        return frozenset(self.image_pages)
+
 
 class PDFDetector:
     """PDF 类型检测器"""
@@ -52,8 +62,9 @@ class PDFDetector:
         total_chars = 0
         
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                page_count = len(pdf.pages)
+            # 类型判断只需要每页字符数，使用 PyMuPDF（C 实现）比 pdfplumber 快一个数量级
+            with fitz.open(pdf_path) as doc:
+                page_count = doc.page_count
                 
                 # 如果页数过多（超过 50 页），进行采样检测以加快速度
                 sample_indices = range(page_count)
@@ -61,21 +72,14 @@ class PDFDetector:
                 if page_count > 50:
                     is_sampled = True
                     # 采样：前 15 页，中间 15 页，最后 15 页
-                    s1 = list(range(min(15, page_count)))
-                    s2 = list(range(max(0, page_count // 2 - 7), min(page_count, page_count // 2 + 8)))
-                    s3 = list(range(max(0, page_count - 15), page_count))
-                    sample_indices = sorted(list(set(s1 + s2 + s3)))
-
-                for i in range(page_count):
-                    # 如果不需要检测所有页面，且不在采样范围内，默认标记为 image (或者根据采样结果推断)
-                    # 这里为了保证 page_count 准确，循环还是要跑，但 extract_text 只在采样点做
-                    if is_sampled and i not in sample_indices:
-                        # 非采样页先假设
-                        continue
-                        
-                    page = pdf.pages[i]
-                    text = page.extract_text() or ""
-                    char_count = len(text.strip())
+                    s1 = range(min(15, page_count))
+                    s2 = range(max(0, page_count // 2 - 7), min(page_count, page_count // 2 + 8))
+                    s3 = range(max(0, page_count - 15), page_count)
+                    sample_indices = sorted({*s1, *s2, *s3})
+
+                # 只遍历采样页，非采样页稍后根据采样结果推断
+                for i in sample_indices:
+                    char_count = self._count_chars(doc, i)
                     total_chars += char_count
                     
                     if char_count >= self.threshold:
@@ -86,8 +90,9 @@ class PDFDetector:
                 # 处理未采样页面的逻辑（如果是采样模式）
                 if is_sampled:
                     # 根据采样比例推算总体类型
-                    sample_text_count = len([idx for idx in text_pages if idx in sample_indices])
-                    sample_image_count = len([idx for idx in image_pages if idx in sample_indices])
+                    # 此时只检测过采样页
+                    sample_text_count = len(text_pages)
+                    sample_image_count = len(image_pages)
                     
                     if sample_text_count > 0 and sample_image_count > 0:
                         pdf_type = "mixed"
@@ -124,6 +129,16 @@ class PDFDetector:
         except Exception as e:
             raise ValueError(f"无法解析 PDF 文件: {str(e)}")
     
+    @staticmethod
+    def _count_chars(doc: fitz.Document, page_num: int) -> int:
+        """统计单页提取出的有效字符数"""
+        page = doc[page_num]
+        # 扫描页通常不引用任何字体（含表单 XObject 中的），不可能有文字，跳过文本提取
+        if not page.get_fonts():
+            return 0
+        # 只需字符数：关闭连字/空白保留等后处理，仅保留页面范围裁剪
+        return len(page.get_text("text", flags=fitz.TEXT_MEDIABOX_CLIP).strip())
+
     def detect_page(self, pdf_path: str | Path, page_num: int) -> Tuple[str, int]:
         """
         检测单个页面类型
@@ -138,13 +153,11 @@ class PDFDetector:
         pdf_path = Path(pdf_path)
         
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                if page_num >= len(pdf.pages):
+            with fitz.open(pdf_path) as doc:
+                if page_num >= doc.page_count:
                     raise ValueError(f"页码 {page_num} 超出范围")
                 
-                page = pdf.pages[page_num]
-                text = page.extract_text() or ""
-                char_count = len(text.strip())
+                char_count = self._count_chars(doc, page_num)
                 
                 page_type = "text" if char_count >= self.threshold else "image"
                 return page_type, char_count
@@ -163,6 +176,9 @@ class PDFDetector:
         Returns:
             提取的文本
         """
+        # pdfplumber（连带 pdfminer）导入较慢，只有提取文本时才需要
+        import pdfplumber
+
         pdf_path = Path(pdf_path)
         
         try:
@@ -183,6 +199,88 @@ class PDFDetector:
         except Exception as e:
             raise ValueError(f"无法提取 PDF 文本: {str(e)}")
 
+    
+    def extract_text_batch(self, pdf_path: str | Path, page_nums: List[int]) -> List[str]:
+        """
+        批量提取多个页面的文本（只打开一次文档）
+        
+        Args:
+            pdf_path: PDF 文件路径
+            page_nums: 页码列表（从 0 开始）
+            
+        Returns:
+            与 page_nums 顺序对应的文本列表
+        """
+        # pdfplumber（连带 pdfminer）导入较慢，只有提取文本时才需要
+        import pdfplumber
+
+        pdf_path = Path(pdf_path)
+        
+        try:
+            with pdfplumber.open(pdf_path) as pdf:
+                page_count = len(pdf.pages)
+                texts = []
+                for page_num in page_nums:
+                    if page_num >= page_count:
+                        raise ValueError(f"页码 {page_num} 超出范围")
+                    page = pdf.pages[page_num]
+                    texts.append(page.extract_text() or "")
+                    # 释放页面解析缓存，避免长文档内存持续增长
+                    page.flush_cache()
+                return texts
+                
+        except Exception as e:
+            raise ValueError(f"无法提取 PDF 文本: {str(e)}")
+
+
+_detector: Optional[PDFDetector] = None
+
+
+def get_detector() -> PDFDetector:
+    """获取全局共享的检测器（无内部状态，可跨任务复用）"""
+    global _detector
+    if _detector is None:
+        _detector = PDFDetector()
+    return _detector
+
+
+# 多进程提取文本时每个子进程至少处理的页数（每个子进程都要重新解析文档结构）
+EXTRACT_PAGES_PER_WORKER = 8
+
+
+def _extract_text_chunk(pdf_path: str, page_nums: List[int]) -> List[str]:
+    """提取一段页面的文本（在 PDF 解析进程池中执行）"""
+    return get_detector().extract_text_batch(pdf_path, page_nums)
+
+
+async def extract_text_batch_async(pdf_path: str | Path, page_nums: List[int]) -> List[str]:
+    """
+    批量提取多个页面的文本，页数较多时分段在 PDF 解析进程池中并行提取
+    
+    pdfplumber 是纯 Python 实现，多线程无法并行，只能多进程
+    
+    Args:
+        pdf_path: PDF 文件路径
+        page_nums: 页码列表（从 0 开始）
+        
+    Returns:
+        与 page_nums 顺序对应的文本列表
+    """
+    from app.core.pool import PARSE_WORKERS, get_parse_pool
+
+    if len(page_nums) <= EXTRACT_PAGES_PER_WORKER or PARSE_WORKERS == 1:
+        return await asyncio.to_thread(get_detector().extract_text_batch, pdf_path, page_nums)
+
+    workers = min(PARSE_WORKERS, -(-len(page_nums) // EXTRACT_PAGES_PER_WORKER))
+    step = -(-len(page_nums) // workers)
+    loop = asyncio.get_running_loop()
+    pool = get_parse_pool()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(pool, _extract_text_chunk, str(pdf_path), page_nums[k:k + step])
+        for k in range(0, len(page_nums), step)
+    ))
+    return [text for chunk_texts in results for text in chunk_texts]
+
 
 def detect_pdf_type(pdf_path: str | Path, threshold: int = None) -> str:
     """
@@ -200,9 +298,20 @@ def detect_pdf_type(pdf_path: str | Path, threshold: int = None) -> str:
     return info.pdf_type
 
 
+@lru_cache(maxsize=64)
+def _detect_cached(path: str, mtime_ns: int, size: int, threshold: int) -> PDFInfo:
+    """按 (路径, 修改时间, 大小) 缓存检测结果，文件变化后自动失效"""
+    return PDFDetector(threshold).detect(path)
+
+
+def _fingerprint(pdf_path: Path) -> Tuple[int, int]:
+    stat = pdf_path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
 def get_pdf_info(pdf_path: str | Path) -> PDFInfo:
     """
-    快捷函数：获取 PDF 详细信息
+    快捷函数：获取 PDF 详细信息（同一文件在进程内只检测一次）
     
     Args:
         pdf_path: PDF 文件路径
@@ -210,5 +319,106 @@ def get_pdf_info(pdf_path: str | Path) -> PDFInfo:
     Returns:
         PDFInfo 对象
     """
-    detector = PDFDetector()
-    return detector.detect(pdf_path)
+    pdf_path = Path(pdf_path)
+    mtime_ns, size = _fingerprint(pdf_path)
+    return _detect_cached(str(pdf_path), mtime_ns, size, settings.PDF_TEXT_THRESHOLD)
+
+
+# 按文件内容哈希缓存的检测结果，重复上传同一文件时跳过检测
+_HASH_CACHE_SIZE = 256
+_hash_cache: "OrderedDict[Tuple[str, int], PDFInfo]" = OrderedDict()
+_hash_cache_lock = threading.Lock()
+
+
+def _get_hashed_pdf_info(file_hash: str, pdf_path: Path) -> Optional[PDFInfo]:
+    key = (file_hash, settings.PDF_TEXT_THRESHOLD)
+    with _hash_cache_lock:
+        pdf_info = _hash_cache.get(key)
+        if pdf_info is None:
+            return None
+        _hash_cache.move_to_end(key)
+    return replace(pdf_info, file_path=str(pdf_path))
+
+
+def _put_hashed_pdf_info(file_hash: str, pdf_info: PDFInfo):
+    key = (file_hash, settings.PDF_TEXT_THRESHOLD)
+    with _hash_cache_lock:
+        _hash_cache[key] = pdf_info
+        _hash_cache.move_to_end(key)
+        while len(_hash_cache) > _HASH_CACHE_SIZE:
+            _hash_cache.popitem(last=False)
+
+
+def _task_fingerprint(pdf_path: Path) -> str:
+    mtime_ns, size = _fingerprint(pdf_path)
+    return f"{size}:{mtime_ns}:{settings.PDF_TEXT_THRESHOLD}"
+
+
+def _load_task_pdf_info(task_id: str, fingerprint: str) -> Optional[PDFInfo]:
+    """读取任务 meta 中与指纹匹配的检测结果"""
+    cached = (read_task_meta(task_id) or {}).get("pdf_info")
+    if cached and cached.get("fingerprint") == fingerprint:
+        return PDFInfo(**cached["info"])
+    return None
+
+
+def _save_task_pdf_info(task_id: str, fingerprint: str, pdf_info: PDFInfo):
+    write_task_meta(
+        task_id,
+        {"pdf_info": {"fingerprint": fingerprint, "info": asdict(pdf_info)}}
+    )
+
+
+def get_task_pdf_info(task_id: str, pdf_path: str | Path) -> PDFInfo:
+    """
+    获取任务 PDF 的检测结果，结果持久化到任务 meta 中，
+    重启后或重复启动 OCR 时无需再次检测
+    
+    Args:
+        task_id: 任务 ID
+        pdf_path: PDF 文件路径
+        
+    Returns:
+        PDFInfo 对象
+    """
+    pdf_path = Path(pdf_path)
+    fingerprint = _task_fingerprint(pdf_path)
+
+    pdf_info = _load_task_pdf_info(task_id, fingerprint)
+    if pdf_info is None:
+        pdf_info = get_pdf_info(pdf_path)
+        _save_task_pdf_info(task_id, fingerprint, pdf_info)
+    return pdf_info
+
+
+async def get_task_pdf_info_async(
+    task_id: str, pdf_path: str | Path, file_hash: str = None
+) -> PDFInfo:
+    """
+    异步获取任务 PDF 的检测结果
+
+    与 get_task_pdf_info 相同，但检测在 PDF 解析进程池中执行，
+    不占用主进程的 GIL；只传递文件路径，子进程自行打开文档
+
+    Args:
+        task_id: 任务 ID
+        pdf_path: PDF 文件路径
+        file_hash: 文件哈希，提供时内容相同的文件复用之前的检测结果
+    """
+    from app.core.pool import get_parse_pool
+
+    pdf_path = Path(pdf_path)
+    fingerprint = await asyncio.to_thread(_task_fingerprint, pdf_path)
+
+    pdf_info = await asyncio.to_thread(_load_task_pdf_info, task_id, fingerprint)
+    if pdf_info is None and file_hash:
+        pdf_info = _get_hashed_pdf_info(file_hash, pdf_path)
+        if pdf_info is not None:
+            await asyncio.to_thread(_save_task_pdf_info, task_id, fingerprint, pdf_info)
+    if pdf_info is None:
+        loop = asyncio.get_running_loop()
+        pdf_info = await loop.run_in_executor(get_parse_pool(), get_pdf_info, str(pdf_path))
+        await asyncio.to_thread(_save_task_pdf_info, task_id, fingerprint, pdf_info)
+    if file_hash:
+        _put_hashed_pdf_info(file_hash, pdf_info)
+    return pdf_info
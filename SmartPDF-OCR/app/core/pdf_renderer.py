@@ -3,14 +3,19 @@ PDF 渲染模块
 将 PDF 页面渲染为高分辨率图片
 """
 
+import threading
 from pathlib import Path
-from typing import List, Optional, Generator
+from contextlib import contextmanager
+from typing import List, Optional, Generator, Iterator, Any
 from dataclasses import dataclass
 import numpy as np
 import fitz  # PyMuPDF
 
 from app.config import settings
 
+# PDFium 不是线程安全的（即使是不同文档），所有调用串行执行
+_pdfium_lock = threading.Lock()
+
 
 @dataclass
 class RenderedPage:
@@ -22,18 +27,55 @@ class RenderedPage:
     dpi: int
 
 
+class _PixmapBuffer:
+    """
+    持有像素图并通过 __array_interface__ 暴露给 numpy，
+    作为数组的 base：数组及其视图全部释放后像素图才被回收
+    （samples_mv 返回的 memoryview 不持有像素图引用，不能直接使用）
+    """
+
+    def __init__(self, pixmap: fitz.Pixmap):
+        self._pixmap = pixmap
+        self.__array_interface__ = {
+            "data": (pixmap.samples_ptr, True),
+            "shape": (pixmap.height, pixmap.width, pixmap.n),
+            "strides": (pixmap.stride, pixmap.n, 1),
+            "typestr": "|u1",
+            "version": 3,
+        }
+
+
+class _BitmapBuffer:
+    """
+    持有 PDFium 位图并通过 __array_interface__ 暴露给 numpy
+    （to_numpy() 返回的数组不持有位图，位图回收后内存即被释放）
+    """
+
+    def __init__(self, bitmap):
+        self._bitmap = bitmap
+        self.__array_interface__ = bitmap.to_numpy().__array_interface__
+
+
 class PDFRenderer:
     """PDF 渲染器"""
     
-    def __init__(self, dpi: int = None):
+    def __init__(self, dpi: int = None, backend: str = None):
         """
         初始化渲染器
         
         Args:
             dpi: 渲染 DPI，默认使用配置值
+            backend: 渲染后端（mupdf/pdfium），默认使用配置值；
+                pdfium 只用于渲染为数组，读取页面尺寸仍由 MuPDF 完成
         """
         self.dpi = dpi or settings.DEFAULT_DPI
+        self.backend = backend or settings.PDF_RENDER_BACKEND
+        if self.backend not in ("mupdf", "pdfium"):
+            raise ValueError(f"不支持的渲染后端: {self.backend}")
         self._validate_dpi()
+        # 保持打开的文档，避免逐页重复打开并解析 xref
+        self._doc: Optional[Any] = None
+        self._doc_path: Optional[Path] = None
     
     def _validate_dpi(self):
         """验证 DPI 值"""
@@ -42,6 +84,100 @@ class PDFRenderer:
         elif self.dpi > settings.MAX_DPI:
             self.dpi = settings.MAX_DPI
     
+    def open(self, pdf_path: str | Path) -> "PDFRenderer":
+        """
+        打开并保持文档，之后对同一文件的 render_page 复用该文档
+        
+        可作为上下文管理器使用：with renderer.open(pdf_path): ...
+        
+        Args:
+            pdf_path: PDF 文件路径
+        """
+        self.close()
+        self._doc = self._open_document(pdf_path, self.backend)
+        self._doc_path = Path(pdf_path)
+        return self
+    
+    def close(self):
+        """关闭保持打开的文档"""
+        if self._doc is not None:
+            self._close_document(self._doc, self.backend)
+            self._doc = None
+            self._doc_path = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
+    def is_open(self, pdf_path: str | Path) -> bool:
+        """文档是否已保持打开"""
+        return self._doc is not None and self._doc_path == Path(pdf_path)
+    
+    @staticmethod
+    def _open_document(pdf_path: str | Path, backend: str) -> Any:
+        """按后端打开文档（fitz.Document 或 pypdfium2.PdfDocument）"""
+        if backend == "mupdf":
+            return fitz.open(pdf_path)
+        # pypdfium2 为可选依赖，只有选择 pdfium 后端时才需要
+        import pypdfium2 as pdfium
+        with _pdfium_lock:
+            return pdfium.PdfDocument(str(pdf_path))
+    
+    @staticmethod
+    def _close_document(doc: Any, backend: str):
+        if backend == "mupdf":
+            doc.close()
+            return
+        with _pdfium_lock:
+            doc.close()
+    
+    @contextmanager
+    def _document(self, pdf_path: str | Path, backend: str = None) -> Iterator[Any]:
+        """
+        使用保持打开的文档；未打开时临时打开，用完关闭
+        
+        Args:
+            backend: 需要的文档类型，默认与渲染后端一致
+        """
+        backend = backend or self.backend
+        if backend == self.backend and self.is_open(pdf_path):
+            yield self._doc
+            return
+        doc = self._open_document(pdf_path, backend)
+        try:
+            yield doc
+        finally:
+            self._close_document(doc, backend)
+    
+    def _get_pixmap(self, page: fitz.Page) -> fitz.Pixmap:
+        """按当前 DPI 渲染为 RGB 像素图（固定 RGB、无 alpha，CMYK 等也统一为 3 通道）"""
+        return page.get_pixmap(dpi=self.dpi, colorspace=fitz.csRGB, alpha=False)
+    
+    @staticmethod
+    def _pixmap_to_array(pixmap: fitz.Pixmap) -> np.ndarray:
+        """
+        像素图转为 numpy 数组（零拷贝）
+        
+        pixmap.samples 每次访问都会复制整页像素，这里直接映射像素图内存，
+        数组存活期间像素图不会被释放；数组只读，需要原地修改时由调用方自行 copy()
+        """
+        return np.asarray(_PixmapBuffer(pixmap))
+    
+    def _render_image(self, doc: Any, page_num: int) -> np.ndarray:
+        """按当前后端与 DPI 将页面渲染为 RGB 数组（只读，零拷贝）"""
+        if self.backend == "mupdf":
+            return self._pixmap_to_array(self._get_pixmap(doc.load_page(page_num)))
+        with _pdfium_lock:
+            page = doc[page_num]
+            try:
+                # rev_byteorder：直接输出 RGB 而不是 PDFium 默认的 BGR
+                bitmap = page.render(scale=self.dpi / 72, rev_byteorder=True)
+            finally:
+                page.close()
+        return np.asarray(_BitmapBuffer(bitmap))
+    
     def render_page(self, pdf_path: str | Path, page_num: int) -> RenderedPage:
         """
         渲染单个页面
@@ -51,46 +187,24 @@ class PDFRenderer:
             page_num: 页码（从 0 开始）
             
         Returns:
-            RenderedPage 对象
+            RenderedPage 对象（image 为只读数组）
         """
-        pdf_path = Path(pdf_path)
-        
         try:
-            doc = fitz.open(pdf_path)
-            
-            if page_num >= len(doc):
-                doc.close()
-                raise ValueError(f"页码 {page_num} 超出范围，共 {len(doc)} 页")
-            
-            page = doc[page_num]
-            
-            # 计算缩放比例
-            zoom = self.dpi / 72  # PDF 默认 72 DPI
-            matrix = fitz.Matrix(zoom, zoom)
-            
-            # 渲染页面为图片
-            pixmap = page.get_pixmap(matrix=matrix)
-            
-            # 转换为 numpy 数组
-            image = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(
-                pixmap.height, pixmap.width, pixmap.n
-            )
-            
-            # 如果是 RGBA，转换为 RGB
-            if pixmap.n == 4:
-                image = image[:, :, :3]
+            with self._document(pdf_path) as doc:
+                if page_num >= len(doc):
+                    raise ValueError(f"页码 {page_num} 超出范围，共 {len(doc)} 页")
+                
+                # 渲染页面为图片
+                image = self._render_image(doc, page_num)
             
-            result = RenderedPage(
+            return RenderedPage(
                 page_num=page_num,
-                image=image.copy(),
-                width=pixmap.width,
-                height=pixmap.height,
+                image=image,
+                width=image.shape[1],
+                height=image.shape[0],
                 dpi=self.dpi
             )
             
-            doc.close()
-            return result
-            
         except Exception as e:
             raise ValueError(f"渲染 PDF 页面失败: {str(e)}")
     
@@ -105,18 +219,11 @@ class PDFRenderer:
             RenderedPage 对象列表
         """
         pdf_path = Path(pdf_path)
-        pages = []
         
         try:
-            doc = fitz.open(pdf_path)
-            page_count = len(doc)
-            doc.close()
-            
-            for i in range(page_count):
-                page = self.render_page(pdf_path, i)
-                pages.append(page)
-            
-            return pages
+            with self.open(pdf_path):
+                page_count = len(self._doc)
+                return self.render_pages(pdf_path, list(range(page_count)))
             
         except Exception as e:
             raise ValueError(f"渲染 PDF 失败: {str(e)}")
@@ -136,11 +243,11 @@ class PDFRenderer:
         Returns:
             RenderedPage 对象列表
         """
-        pages = []
-        for page_num in page_nums:
-            page = self.render_page(pdf_path, page_num)
-            pages.append(page)
-        return pages
+        if self.is_open(pdf_path):
+            return [self.render_page(pdf_path, page_num) for page_num in page_nums]
+        
+        with self.open(pdf_path):
+            return [self.render_page(pdf_path, page_num) for page_num in page_nums]
     
     def render_generator(
         self, 
@@ -158,47 +265,33 @@ class PDFRenderer:
         pdf_path = Path(pdf_path)
         
         try:
-            doc = fitz.open(pdf_path)
-            page_count = len(doc)
-            
-            for i in range(page_count):
-                page = doc[i]
-                
-                # 计算缩放比例
-                zoom = self.dpi / 72
-                matrix = fitz.Matrix(zoom, zoom)
-                
-                # 渲染页面
-                pixmap = page.get_pixmap(matrix=matrix)
-                
-                # 转换为 numpy 数组
-                image = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(
-                    pixmap.height, pixmap.width, pixmap.n
-                )
-                
-                if pixmap.n == 4:
-                    image = image[:, :, :3]
+            doc = self._open_document(pdf_path, self.backend)
+        except Exception as e:
+            raise ValueError(f"渲染 PDF 失败: {str(e)}")
+        
+        # 提前关闭生成器时也要关闭文档
+        try:
+            for i in range(len(doc)):
+                try:
+                    image = self._render_image(doc, i)
+                except Exception as e:
+                    raise ValueError(f"渲染 PDF 失败: {str(e)}")
                 
                 yield RenderedPage(
                     page_num=i,
-                    image=image.copy(),
-                    width=pixmap.width,
-                    height=pixmap.height,
+                    image=image,
+                    width=image.shape[1],
+                    height=image.shape[0],
                     dpi=self.dpi
                 )
-            
-            doc.close()
-            
-        except Exception as e:
-            raise ValueError(f"渲染 PDF 失败: {str(e)}")
+        finally:
+            self._close_document(doc, self.backend)
     
     def get_page_count(self, pdf_path: str | Path) -> int:
         """获取 PDF 页数"""
         try:
-            doc = fitz.open(pdf_path)
-            count = len(doc)
-            doc.close()
-            return count
+            with self._document(pdf_path) as doc:
+                return len(doc)
         except Exception as e:
             raise ValueError(f"无法获取 PDF 页数: {str(e)}")
     
@@ -210,14 +303,10 @@ class PDFRenderer:
             (width, height) 单位为点
         """
         try:
-            doc = fitz.open(pdf_path)
-            if page_num >= len(doc):
-                doc.close()
-                raise ValueError(f"页码 {page_num} 超出范围")
-            
-            page = doc[page_num]
-            rect = page.rect
-            doc.close()
+            with self._document(pdf_path, backend="mupdf") as doc:
+                if page_num >= len(doc):
+                    raise ValueError(f"页码 {page_num} 超出范围")
+                rect = doc[page_num].rect
             
             return (rect.width, rect.height)
             
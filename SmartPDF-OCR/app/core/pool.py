@@ -0,0 +1,271 @@
+"""
+进程池
+页面渲染与去噪/纠偏/二值化、上传后的 PDF 结构解析都属于 CPU 密集型任务，
+放到独立进程中执行，使其与主进程中的 OCR 推理和事件循环并行，不再争抢 GIL
+"""
+
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+from typing import Optional, Dict, Any, Tuple, Iterable, Iterator, Callable, Union
+
+import numpy as np
+
+# 预处理进程数（过多会与 OCR 推理争抢 CPU 和内存）
+PREPROCESS_WORKERS = min(os.cpu_count() or 1, 4)
+# PDF 解析进程数
+PARSE_WORKERS = min(os.cpu_count() or 1, 4)
+
+# 共享内存句柄：(名称, 形状, dtype)；Windows 下为数组本身
+SharedImage = Union[Tuple[str, Tuple[int, ...], str], np.ndarray]
+
+# Windows 的共享内存在最后一个句柄关闭时即被释放，子进程返回前主进程尚未打开，
+# 且没有 resource_tracker；因此只在 POSIX 上经共享内存传递图像
+USE_SHARED_MEMORY = os.name == "posix"
+
+_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# 子进程内保持打开的渲染器，同一 PDF 的后续页面无需重新打开文档
+_worker_renderer = None
+
+
+def _init_preprocess_worker():
+    """子进程启动时预先导入渲染与预处理模块（PyMuPDF/OpenCV），首个任务不再承担导入耗时"""
+    import app.core.pdf_renderer
+    import app.preprocess
+
+
+def _init_parse_worker():
+    """子进程启动时预先导入 PDF 检测模块（PyMuPDF）"""
+    import app.core.pdf_detector
+
+
+def get_preprocess_pool() -> ProcessPoolExecutor:
+    """获取全局预处理进程池（首次调用时创建）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # 使用 spawn：主进程已加载 Paddle/CUDA，fork 出的子进程不安全
+                _pool = ProcessPoolExecutor(
+                    max_workers=PREPROCESS_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_preprocess_worker
+                )
+    return _pool
+
+
+def shutdown_preprocess_pool():
+    """关闭全局预处理进程池"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """获取全局 PDF 解析进程池（首次调用时创建）"""
+    global _parse_pool
+    if _parse_pool is None:
+        with _pool_lock:
+            if _parse_pool is None:
+                _parse_pool = ProcessPoolExecutor(
+                    max_workers=PARSE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_parse_worker
+                )
+    return _parse_pool
+
+
+def shutdown_parse_pool():
+    """关闭全局 PDF 解析进程池"""
+    global _parse_pool
+    with _pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=False, cancel_futures=True)
+            _parse_pool = None
+
+
+def _get_worker_renderer(pdf_path: str, dpi: int, backend: Optional[str] = None):
+    """获取子进程内的渲染器，文件、DPI 或渲染后端变化时重新打开"""
+    global _worker_renderer
+    from app.core.pdf_renderer import PDFRenderer
+
+    renderer = _worker_renderer
+    if (
+        renderer is None or renderer.dpi != dpi or not renderer.is_open(pdf_path)
+        or (backend is not None and renderer.backend != backend)
+    ):
+        if renderer is not None:
+            renderer.close()
+        renderer = PDFRenderer(dpi=dpi, backend=backend).open(pdf_path)
+        _worker_renderer = renderer
+    return renderer
+
+
+def prestart_workers(pool: ProcessPoolExecutor, count: int):
+    """
+    预先启动子进程
+
+    spawn 方式下子进程在提交任务时才按需创建，并执行 initializer 导入依赖；
+    启动时提交 count 个空任务，把这部分耗时移出首个请求
+    """
+    for _ in range(count):
+        pool.submit(os.getpid)
+
+
+def _release_worker_renderer():
+    """关闭子进程内保持打开的文档（释放文件句柄）"""
+    global _worker_renderer
+    if _worker_renderer is not None:
+        _worker_renderer.close()
+        _worker_renderer = None
+
+
+def preprocess_page(pdf_path: str, page_num: int, opts: Dict[str, Any]) -> SharedImage:
+    """
+    渲染并预处理单页（在子进程中执行）
+
+    POSIX 上结果写入共享内存而不是直接返回数组，避免 300 DPI 整页图像
+    （约 25 MB）在进程间 pickle 传输；Windows 上直接返回数组
+
+    Args:
+        pdf_path: PDF 文件路径
+        page_num: 页码（从 0 开始）
+        opts: 预处理选项（dpi/preprocess/denoise/deskew/binarize），
+            backend 指定渲染后端（默认使用配置值），
+            close_after 为真时处理完本页后关闭文档
+
+    Returns:
+        图像句柄，由 load_shared_image 读取并释放
+    """
+    from app.preprocess import denoise, binarize, deskew, ensure_grayscale
+
+    try:
+        renderer = _get_worker_renderer(pdf_path, opts["dpi"], opts.get("backend"))
+        img = renderer.render_page(pdf_path, page_num).image
+    finally:
+        if opts.get("close_after"):
+            _release_worker_renderer()
+    if opts["preprocess"]:
+        if opts["binarize"]:
+            # 二值化输出本就是灰度图：先转换一次，去噪/纠偏只处理单通道，
+            # 二值化也不必再转换
+            img = ensure_grayscale(img)
+        if opts["denoise"]:
+            img = denoise(img, method="gaussian")
+        if opts["deskew"]:
+            img, _ = deskew(img)
+        if opts["binarize"]:
+            img = binarize(img, method="otsu")
+
+    img = np.ascontiguousarray(img)
+    if not USE_SHARED_MEMORY:
+        return img
+    shm = shared_memory.SharedMemory(create=True, size=max(img.nbytes, 1))
+    try:
+        np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[...] = img
+        # 生命周期交给主进程管理，避免子进程退出时被 resource_tracker 提前回收
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm.name, img.shape, img.dtype.str
+    finally:
+        shm.close()
+
+
+class _SharedImageBuffer:
+    """
+    持有共享内存并通过 __array_interface__ 暴露给 numpy，
+    作为数组的 base：数组及其视图全部释放后才关闭共享内存
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, shape: Tuple[int, ...], dtype: str):
+        self._shm = shm
+        probe = np.frombuffer(shm.buf, dtype=np.uint8)
+        address = probe.__array_interface__["data"][0]
+        # 只取地址，不保留对 shm.buf 的导出，否则 close() 会失败
+        del probe
+        self.__array_interface__ = {
+            "data": (address, False),
+            "shape": tuple(shape),
+            "typestr": np.dtype(dtype).str,
+            "version": 3,
+        }
+
+    def __del__(self):
+        self._shm.close()
+
+
+def load_shared_image(handle: SharedImage) -> np.ndarray:
+    """
+    读取子进程写入的共享内存图像（零拷贝）
+
+    返回的数组直接映射共享内存；名称随即被移除，
+    映射在数组（及其视图）释放后回收
+    """
+    if isinstance(handle, np.ndarray):
+        return handle
+    name, shape, dtype = handle
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        image = np.asarray(_SharedImageBuffer(shm, shape, dtype))
+    finally:
+        shm.unlink()
+    return image
+
+
+def discard_shared_image(handle: SharedImage):
+    """释放未被读取的共享内存（任务中途失败时使用）"""
+    if isinstance(handle, np.ndarray):
+        return
+    try:
+        shm = shared_memory.SharedMemory(name=handle[0])
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def discard_future_image(future: Future):
+    """释放已放弃的预处理结果所占用的共享内存"""
+    if not future.cancelled() and future.exception() is None:
+        discard_shared_image(future.result())
+
+
+def prefetch(
+    executor: Executor,
+    fn: Callable,
+    jobs: Iterable[tuple],
+    max_inflight: int,
+    on_abandon: Optional[Callable[[Future], None]] = None
+) -> Iterator[Tuple[tuple, Future]]:
+    """
+    按顺序提交任务并依次产出 (参数, future)
+
+    最多保持 max_inflight 个已提交、尚未产出的任务；每取走一个就补交一个。
+    生成器提前关闭时，未产出的任务会被取消，已在运行的交给 on_abandon 处理
+
+    Args:
+        executor: 执行器
+        fn: 任务函数
+        jobs: 参数元组序列
+        max_inflight: 预取窗口大小
+        on_abandon: 已开始运行、无法取消的任务完成后的回调
+    """
+    pending = deque()
+    try:
+        for args in jobs:
+            pending.append((args, executor.submit(fn, *args)))
+            if len(pending) >= max_inflight:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+    finally:
+        for _, future in pending:
+            if not future.cancel() and on_abandon is not None:
+                future.add_done_callback(on_abandon)
@@ -0,0 +1,152 @@
+"""
+任务状态存储
+默认保存在进程内；配置 REDIS_URL 后使用 Redis 哈希（task:{id}），
+多个 API worker 与独立的 OCR worker 进程可共享任务进度
+"""
+
+import time
+import asyncio
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator
+
+import orjson
+
+from app.config import settings
+
+
+class TaskStore:
+    """任务状态存储"""
+
+    def __init__(self, redis_url: str = None, ttl: int = None, prefix: str = "task"):
+        """
+        初始化存储
+
+        Args:
+            redis_url: Redis 连接地址，为空时使用进程内存储
+            ttl: 状态过期时间（秒）
+            prefix: Redis 键前缀
+        """
+        self.redis_url = redis_url if redis_url is not None else settings.REDIS_URL
+        self.ttl = ttl or settings.TASK_STATUS_TTL
+        self.prefix = prefix
+        # 进程内存储：task_id -> (过期时间, 状态)；状态字典写入后不再修改，
+        # 更新时整体替换，读取方拿到的始终是完整快照
+        self._local: Dict[str, tuple] = {}
+        # OCR 任务在后台线程的独立事件循环中写入，与 API 读取跨线程
+        self._local_lock = threading.Lock()
+        # redis.asyncio 客户端绑定事件循环，每个循环各自持有一个
+        self._clients = weakref.WeakKeyDictionary()
+        # 状态变化订阅者：task_id -> {(事件循环, asyncio.Event)}
+        self._subscribers: Dict[str, set] = {}
+        self._sub_lock = threading.Lock()
+
+    def _key(self, task_id: str) -> str:
+        return f"{self.prefix}:{task_id}"
+
+    def _get_client(self):
+        """获取当前事件循环对应的 Redis 客户端"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.Redis.from_url(self.redis_url)
+            self._clients[loop] = client
+        return client
+
+    async def aclose(self):
+        """关闭当前事件循环对应的 Redis 客户端（事件循环结束前调用）"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+    def _purge_expired(self, now: float):
+        """清理进程内已过期的状态"""
+        expired = [k for k, (expires, _) in self._local.items() if expires <= now]
+        for k in expired:
+            del self._local[k]
+
+    async def get_status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取任务状态
+
+        Returns:
+            状态字典，不存在时返回 None
+        """
+        if not self.redis_url:
+            with self._local_lock:
+                entry = self._local.get(task_id)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return dict(entry[1])
+
+        raw = await self._get_client().hgetall(self._key(task_id))
+        if not raw:
+            return None
+        return {k.decode(): orjson.loads(v) for k, v in raw.items()}
+
+    async def set_status(self, task_id: str, **fields):
+        """
+        更新任务状态的若干字段，并刷新过期时间
+        """
+        if not self.redis_url:
+            now = time.monotonic()
+            with self._local_lock:
+                self._purge_expired(now)
+                entry = self._local.get(task_id)
+                status = {**entry[1], **fields} if entry else fields
+                self._local[task_id] = (now + self.ttl, status)
+            self._notify(task_id)
+            return
+
+        key = self._key(task_id)
+        mapping = {
+            k: orjson.dumps(v, option=orjson.OPT_SERIALIZE_NUMPY)
+            for k, v in fields.items()
+        }
+        # HSET 与 EXPIRE 合并为一次往返
+        async with self._get_client().pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+        self._notify(task_id)
+
+    @contextmanager
+    def subscribe(self, task_id: str) -> Iterator[asyncio.Event]:
+        """
+        订阅任务状态变化
+
+        本进程内的 set_status 会置位返回的 Event（可跨线程/事件循环），
+        订阅方读取状态后自行 clear()。其他进程写入 Redis 的变化不会通知，
+        订阅方应配合超时定期读取
+        """
+        event = asyncio.Event()
+        entry = (asyncio.get_running_loop(), event)
+        with self._sub_lock:
+            self._subscribers.setdefault(task_id, set()).add(entry)
+        try:
+            yield event
+        finally:
+            with self._sub_lock:
+                subs = self._subscribers.get(task_id)
+                if subs is not None:
+                    subs.discard(entry)
+                    if not subs:
+                        del self._subscribers[task_id]
+
+    def _notify(self, task_id: str):
+        """通知订阅者状态已变化"""
+        with self._sub_lock:
+            subs = list(self._subscribers.get(task_id, ()))
+        for loop, event in subs:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # 订阅方的事件循环已关闭
+                pass
+
+
+# 全局 OCR 任务状态存储
+task_store = TaskStore()
@@ -3,14 +3,31 @@ DOCX 导出模块
 将 OCR 结果导出为 Word 文档
 """
 
+import io
+import re
+import zipfile
 from pathlib import Path
-from typing import List, Union, Optional
+from typing import List, Union, Optional, Iterator
+from xml.sax.saxutils import escape
 from docx import Document
 from docx.shared import Pt, Inches, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml.ns import qn
 
 from app.ocr.postprocess import ProcessedPage
 
+# Markdown 行内加粗 **text** 与有序列表项 "1. text"
+_BOLD_RE = re.compile(r'\*\*(.+?)\*\*')
+_ORDERED_ITEM_RE = re.compile(r'\d+\.\s(.*)')
+
+# 正文文本块使用的字符样式名
+RUN_STYLE_NAME = "OCRBody"
+
+# XML 1.0 不允许的控制字符（制表符/换行除外）
+_XML_ILLEGAL_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_PAGE_BREAK_XML = b'<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
 
 class DocxExporter:
     """DOCX 导出器"""
@@ -68,19 +85,24 @@ class DocxExporter:
         
         doc = Document()
         
-        # 设置页面尺寸
+        # 设置页面尺寸与正文样式
         self._setup_page(doc)
+        self._setup_styles(doc)
         
         # 添加标题
         if title:
             self._add_title(doc, title)
         
+        # 普通内容不经过 python-docx 对象树，直接写入正文 XML
+        if not is_markdown:
+            self._save_with_body(
+                doc, output_path, self._iter_body_xml(pages, include_page_breaks)
+            )
+            return output_path
+        
         # 添加内容
         for i, page in enumerate(pages):
-            if is_markdown:
-                self._add_markdown_content(doc, page)
-            else:
-                self._add_page_content(doc, page)
+            self._add_markdown_content(doc, page)
             
             # 添加分页符
             if include_page_breaks and i < len(pages) - 1:
@@ -99,22 +121,70 @@ class DocxExporter:
         section.top_margin = Cm(self.margin)
         section.bottom_margin = Cm(self.margin)
     
+    def _setup_styles(self, doc: Document) -> None:
+        """
+        创建正文字符样式
+
+        字体、字号与东亚字体只在样式中设置一次，文本块按名称引用，
+        不再逐个写入 rPr 属性
+        """
+        style = doc.styles.add_style(RUN_STYLE_NAME, WD_STYLE_TYPE.CHARACTER)
+        style.font.name = self.font_name
+        style.font.size = Pt(self.font_size)
+        style.element.rPr.rFonts.set(qn('w:eastAsia'), self.font_name)
+    
     def _add_title(self, doc: Document, title: str) -> None:
         """添加标题"""
         heading = doc.add_heading(title, level=0)
         heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
     
-    def _add_page_content(self, doc: Document, page: ProcessedPage) -> None:
-        """添加普通页面内容"""
-        for paragraph in page.paragraphs:
-            p = doc.add_paragraph()
-            self._add_run_with_style(p, paragraph.text)
-            p.paragraph_format.line_spacing = self.line_spacing
-
+    def _paragraph_xml(self, text: str) -> bytes:
+        """生成普通段落的 XML（正文样式与行距；制表符/换行的处理与 python-docx 一致）"""
+        text = escape(_XML_ILLEGAL_RE.sub('', text))
+        text = re.sub(r'\r\n?|\n', '</w:t><w:br/><w:t xml:space="preserve">', text)
+        text = text.replace('\t', '</w:t><w:tab/><w:t xml:space="preserve">')
+        return (
+            f'<w:p><w:pPr><w:spacing w:line="{round(self.line_spacing * 240)}" w:lineRule="auto"/></w:pPr>'
+            f'<w:r><w:rPr><w:rStyle w:val="{RUN_STYLE_NAME}"/></w:rPr>'
+            f'<w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+        ).encode('utf-8')
+    
+    def _iter_body_xml(
+        self, pages: List[ProcessedPage], include_page_breaks: bool
+    ) -> Iterator[bytes]:
+        """逐段生成正文 XML"""
+        for i, page in enumerate(pages):
+            for paragraph in page.paragraphs:
+                yield self._paragraph_xml(paragraph.text)
+            if include_page_breaks and i < len(pages) - 1:
+                yield _PAGE_BREAK_XML
+    
+    @staticmethod
+    def _save_with_body(doc: Document, output_path: Path, body: Iterator[bytes]) -> None:
+        """
+        保存文档，并把 body 中的段落 XML 流式写入正文末尾（节属性之前）
+        
+        大文档不再在内存中构建并序列化整棵 lxml 树；页面设置、样式与标题仍由 python-docx 生成
+        """
+        template = io.BytesIO()
+        doc.save(template)
+        with zipfile.ZipFile(template) as src, \
+                zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as dst:
+            for item in src.infolist():
+                data = src.read(item.filename)
+                if item.filename != "word/document.xml":
+                    dst.writestr(item, data)
+                    continue
+                # 最后一个 sectPr 是正文的节属性，段落插在它之前
+                cut = data.rindex(b"<w:sectPr")
+                with dst.open(item, "w", force_zip64=True) as f:
+                    f.write(data[:cut])
+                    for chunk in body:
+                        f.write(chunk)
+                    f.write(data[cut:])
+    
     def _add_markdown_content(self, doc: Document, page: ProcessedPage) -> None:
         """解析并添加 Markdown 内容"""
-        import re
-        
         # 合并所有段落文本（通常 AI 结果是一大段）
         full_text = "\n".join([p.text for p in page.paragraphs])
         lines = full_text.split('\n')
@@ -127,50 +197,40 @@ class DocxExporter:
             # 标题 (Headers)
             if line.startswith('#'):
                 # 计算级别
-                level = 0
-                for char in line:
-                    if char == '#':
-                        level += 1
-                    else:
-                        break
+                level = len(line) - len(line.lstrip('#'))
                 content = line[level:].strip()
-                if level > 9: level = 9
-                doc.add_heading(content, level=level)
+                doc.add_heading(content, level=min(level, 9))
                 continue
             
             # 列表 (Lists)
+            ordered = _ORDERED_ITEM_RE.match(line)
             if line.startswith('- ') or line.startswith('* '):
                 content = line[2:].strip()
                 p = doc.add_paragraph(style='List Bullet')
-            elif re.match(r'^\d+\.\s', line):
+            elif ordered:
                 # 简单有序列表检测
-                match = re.match(r'^(\d+\.\s)(.*)', line)
-                content = match.group(2)
+                content = ordered.group(1)
                 p = doc.add_paragraph(style='List Number')
             else:
                 p = doc.add_paragraph()
                 content = line
                 p.paragraph_format.line_spacing = self.line_spacing
             
-            # 内联格式处理 (Bold)
-            # 分割 **bold**
-            parts = re.split(r'(\*\*.*?\*\*)', content)
-            for part in parts:
-                if part.startswith('**') and part.endswith('**') and len(part) > 4:
-                    self._add_run_with_style(p, part[2:-2], bold=True)
-                else:
-                    self._add_run_with_style(p, part)
+            # 内联格式处理 (Bold)：一次扫描，加粗片段之间的文本按普通样式添加
+            pos = 0
+            for match in _BOLD_RE.finditer(content):
+                if match.start() > pos:
+                    self._add_run_with_style(p, content[pos:match.start()])
+                self._add_run_with_style(p, match.group(1), bold=True)
+                pos = match.end()
+            if pos < len(content):
+                self._add_run_with_style(p, content[pos:])
 
     def _add_run_with_style(self, paragraph, text, bold=False):
         """添加带样式的文本块"""
-        run = paragraph.add_run(text)
-        run.bold = bold
-        run.font.name = self.font_name
-        run.font.size = Pt(self.font_size)
-        run._element.rPr.rFonts.set(
-            '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}eastAsia',
-            self.font_name
-        )
+        run = paragraph.add_run(text, style=RUN_STYLE_NAME)
+        if bold:
+            run.bold = True
     
     def export_with_confidence(
         self,
@@ -196,21 +256,17 @@ class DocxExporter:
         
         doc = Document()
         self._setup_page(doc)
+        self._setup_styles(doc)
         
         for page in pages:
             for paragraph in page.paragraphs:
                 p = doc.add_paragraph()
+                run = p.add_run(paragraph.text, style=RUN_STYLE_NAME)
                 
                 # 检查置信度
                 if paragraph.avg_confidence < highlight_threshold:
                     # 低置信度用红色标记
-                    run = p.add_run(paragraph.text)
                     run.font.color.rgb = RGBColor(255, 0, 0)
-                else:
-                    run = p.add_run(paragraph.text)
-                
-                run.font.name = self.font_name
-                run.font.size = Pt(self.font_size)
         
         doc.save(str(output_path))
         return output_path
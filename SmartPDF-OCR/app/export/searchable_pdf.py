@@ -10,6 +10,34 @@ import fitz  # PyMuPDF
 from app.ocr.engine import OCRResult, OCRLine
 from app.config import settings
 
+# 文本层使用的 PyMuPDF 内置中文字体（同时作为页面资源中的字体名）
+TEXT_LAYER_FONT = "china-s"
+
+
+def _share_font(doc: fitz.Document, page: fitz.Page, font_xref: int) -> bool:
+    """
+    在页面字体资源中直接引用文档内已嵌入的文本层字体
+
+    页面资源继承自父节点等无法安全修改的情况返回 False，由调用方正常插入字体
+    """
+    if any(font[4] == TEXT_LAYER_FONT for font in page.get_fonts()):
+        return True
+    kind, value = doc.xref_get_key(page.xref, "Resources")
+    if kind == "xref":
+        res_xref, prefix = int(value.split()[0]), ""
+    elif kind == "dict":
+        res_xref, prefix = page.xref, "Resources/"
+    else:
+        return False
+    kind, value = doc.xref_get_key(res_xref, prefix + "Font")
+    if kind == "xref":
+        doc.xref_set_key(int(value.split()[0]), TEXT_LAYER_FONT, f"{font_xref} 0 R")
+    elif kind in ("dict", "null"):
+        doc.xref_set_key(res_xref, f"{prefix}Font/{TEXT_LAYER_FONT}", f"{font_xref} 0 R")
+    else:
+        return False
+    return True
+
 
 class SearchablePDFCreator:
     """可搜索 PDF 生成器"""
@@ -53,7 +81,8 @@ class SearchablePDFCreator:
         # 打开原始 PDF
         doc = fitz.open(pdf_path)
         
-        # 为每页添加文本层
+        # 为每页添加文本层（字体只嵌入一次，各页共用）
+        font_xref = None
         for ocr_result in ocr_results:
             page_num = ocr_result.page_num
             
@@ -61,7 +90,7 @@ class SearchablePDFCreator:
                 continue
             
             page = doc[page_num]
-            self._add_text_layer(page, ocr_result)
+            font_xref = self._add_text_layer(page, ocr_result, font_xref)
         
         # 保存
         doc.save(str(output_path))
@@ -69,43 +98,70 @@ class SearchablePDFCreator:
         
         return output_path
     
-    def _add_text_layer(self, page: fitz.Page, ocr_result: OCRResult) -> None:
-        """为页面添加文本层"""
-        # 获取页面尺寸
-        page_rect = page.rect
-        page_width = page_rect.width
-        page_height = page_rect.height
-        
+    def _add_text_layer(
+        self,
+        page: fitz.Page,
+        ocr_result: OCRResult,
+        font_xref: Optional[int] = None
+    ) -> Optional[int]:
+        """为页面添加文本层，返回文本层字体的 xref（供后续页面复用）"""
         # 获取渲染时的 DPI（假设为 300）
         render_dpi = settings.DEFAULT_DPI
         scale_factor = 72 / render_dpi  # PDF 默认 72 DPI
         
-        for line in ocr_result.lines:
+        # 坐标需要从图像坐标转换为 PDF 坐标
+        return self._write_text_lines(
+            page, ocr_result.lines, scale_factor, scale_factor, font_xref
+        )
+    
+    @staticmethod
+    def _write_text_lines(
+        page: fitz.Page,
+        lines: List[OCRLine],
+        scale_x: float,
+        scale_y: float,
+        font_xref: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        按缩放比例把文本行写为不可见文本
+        
+        整页文本先写入 Shape，最后一次性提交，避免逐行改写页面内容流。
+        给出 font_xref 时页面直接引用该字体，不再为每页重新嵌入 CJK 字体
+        
+        Returns:
+            文本层字体的 xref
+        """
+        if not lines:
+            return font_xref
+        if font_xref is None or not _share_font(page.parent, page, font_xref):
+            font_xref = page.insert_font(fontname=TEXT_LAYER_FONT)
+        
+        shape = page.new_shape()
+        insert = shape.insert_text
+        Point = fitz.Point
+        font_scale = scale_y * 0.8
+        
+        for line in lines:
             try:
-                # 计算文本位置（需要从图像坐标转换为 PDF 坐标）
-                x = line.x_min * scale_factor
-                y = line.y_min * scale_factor
-                
                 # 计算字体大小
-                font_size = line.height * scale_factor * 0.8
+                font_size = line.height * font_scale
                 if font_size < 1:
                     font_size = 8
                 
-                # 创建文本插入点
-                point = fitz.Point(x, y + font_size)
-                
                 # 插入透明文本
-                page.insert_text(
-                    point,
+                insert(
+                    Point(line.x_min * scale_x, line.y_min * scale_y + font_size),
                     line.text,
                     fontsize=font_size,
-                    fontname="china-s",  # 使用内置中文字体
+                    fontname=TEXT_LAYER_FONT,  # 使用内置中文字体
                     color=(0, 0, 0),
                     render_mode=3  # 不可见但可搜索
                 )
-            except Exception as e:
+            except Exception:
                 # 跳过无法插入的文本
                 continue
+        shape.commit()
+        return font_xref
     
     def create_from_images(
         self,
@@ -127,8 +183,6 @@ class SearchablePDFCreator:
             输出文件路径
         """
         import numpy as np
-        from PIL import Image
-        import io
         
         output_path = Path(output_path)
         output_path.parent.mkdir(parents=True, exist_ok=True)
@@ -137,34 +191,27 @@ class SearchablePDFCreator:
         
         # 创建新 PDF
         doc = fitz.open()
+        font_xref = None
         
         for i, image in enumerate(images):
-            # 转换图像格式
-            if isinstance(image, np.ndarray):
-                pil_image = Image.fromarray(image)
-            else:
-                pil_image = image
-            
-            # 将图像转换为字节
-            img_bytes = io.BytesIO()
-            pil_image.save(img_bytes, format="PNG")
-            img_bytes.seek(0)
+            # 直接由像素数据构造 Pixmap 插入，不再经 PIL 编码 PNG 再由 MuPDF 解码
+            pixmap = self._image_to_pixmap(np.asarray(image))
             
             # 计算页面尺寸（点）
-            width_pt = pil_image.width * 72 / dpi
-            height_pt = pil_image.height * 72 / dpi
+            width_pt = pixmap.width * 72 / dpi
+            height_pt = pixmap.height * 72 / dpi
             
             # 创建新页面
             page = doc.new_page(width=width_pt, height=height_pt)
             
             # 插入图像
             rect = page.rect
-            page.insert_image(rect, stream=img_bytes.getvalue())
+            page.insert_image(rect, pixmap=pixmap)
             
             # 添加文本层
             if i < len(ocr_results):
-                self._add_text_layer_for_image(
-                    page, ocr_results[i], pil_image.width, pil_image.height, dpi
+                font_xref = self._add_text_layer_for_image(
+                    page, ocr_results[i], pixmap.width, pixmap.height, dpi, font_xref
                 )
         
         doc.save(str(output_path))
@@ -172,41 +219,31 @@ class SearchablePDFCreator:
         
         return output_path
     
+    @staticmethod
+    def _image_to_pixmap(image) -> fitz.Pixmap:
+        """numpy 图像（灰度/RGB/RGBA，uint8）转为 Pixmap"""
+        import numpy as np
+        
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        colorspace = fitz.csGRAY if channels in (1, 2) else fitz.csRGB
+        alpha = 1 if channels in (2, 4) else 0
+        return fitz.Pixmap(colorspace, width, height, image.tobytes(), alpha)
+    
     def _add_text_layer_for_image(
         self,
         page: fitz.Page,
         ocr_result: OCRResult,
         image_width: int,
         image_height: int,
-        dpi: int
-    ) -> None:
-        """为图像页面添加文本层"""
+        dpi: int,
+        font_xref: Optional[int] = None
+    ) -> Optional[int]:
+        """为图像页面添加文本层，返回文本层字体的 xref"""
         scale_x = page.rect.width / image_width
         scale_y = page.rect.height / image_height
-        
-        for line in ocr_result.lines:
-            try:
-                # 转换坐标
-                x = line.x_min * scale_x
-                y = line.y_min * scale_y
-                
-                # 计算字体大小
-                font_size = line.height * scale_y * 0.8
-                if font_size < 1:
-                    font_size = 8
-                
-                point = fitz.Point(x, y + font_size)
-                
-                page.insert_text(
-                    point,
-                    line.text,
-                    fontsize=font_size,
-                    fontname="china-s",
-                    color=(0, 0, 0),
-                    render_mode=3
-                )
-            except Exception:
-                continue
+        return self._write_text_lines(page, ocr_result.lines, scale_x, scale_y, font_xref)
 
 
 def create_searchable_pdf(
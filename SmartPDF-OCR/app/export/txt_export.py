@@ -3,11 +3,15 @@ TXT 导出模块
 将 OCR 结果导出为纯文本文件
 """
 
+import os
 from pathlib import Path
-from typing import List, Union
+from typing import List, Union, Iterator
 
 from app.ocr.postprocess import ProcessedPage
 
+# 累积到该字符数后统一编码写入
+WRITE_BLOCK_CHARS = 1 << 20
+
 
 class TxtExporter:
     """TXT 导出器"""
@@ -51,30 +55,66 @@ class TxtExporter:
         output_path = Path(output_path)
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
-        content = self._generate_content(pages)
-        
-        with open(output_path, "w", encoding=self.encoding) as f:
-            f.write(content)
+        # 逐段写入文件，不在内存中拼出整份文本
+        self._write_chunks(output_path, self._iter_chunks(pages))
         
         return output_path
     
-    def _generate_content(self, pages: List[ProcessedPage]) -> str:
-        """生成文本内容"""
-        parts = []
+    def _write_chunks(self, output_path: Path, chunks: Iterator[str]) -> None:
+        """
+        按块编码并以二进制方式写入文本片段
+        
+        片段累积到 WRITE_BLOCK_CHARS 后一次性编码写入，跳过文本 IO 层的逐次编码；
+        换行转换与文本模式写入一致
+        """
+        block: List[str] = []
+        size = 0
+        
+        with open(output_path, "wb") as f:
+            def flush():
+                text = "".join(block)
+                if os.linesep != "\n":
+                    text = text.replace("\n", os.linesep)
+                f.write(text.encode(self.encoding))
+                block.clear()
+            
+            for chunk in chunks:
+                block.append(chunk)
+                size += len(chunk)
+                if size >= WRITE_BLOCK_CHARS:
+                    flush()
+                    size = 0
+            flush()
+    
+    def _iter_chunks(self, pages: List[ProcessedPage]) -> Iterator[str]:
+        """
+        按顺序产出文本片段（页面分隔符、段落及段落分隔符）
+        
+        逐段产出，不为每页先拼出整页字符串
+        """
+        paragraph_sep = self.paragraph_separator
+        page_sep = self.page_separator if self.include_page_numbers else None
         
         for i, page in enumerate(pages):
             # 添加页面分隔符
-            if i > 0 and self.include_page_numbers:
-                separator = self.page_separator.format(page=page.page_num + 1)
-                parts.append(separator)
+            if i > 0 and page_sep is not None:
+                yield page_sep.format(page=page.page_num + 1)
             
             # 添加页面内容
-            page_text = self.paragraph_separator.join(
-                p.text for p in page.paragraphs
-            )
-            parts.append(page_text)
-        
-        return "".join(parts)
+            for j, paragraph in enumerate(page.paragraphs):
+                if j:
+                    yield paragraph_sep
+                yield paragraph.text
+    
+    def _iter_simple_chunks(self, pages: List[ProcessedPage]) -> Iterator[str]:
+        """按顺序产出所有段落及段落分隔符（不含页面分隔）"""
+        first = True
+        for page in pages:
+            for paragraph in page.paragraphs:
+                if not first:
+                    yield self.paragraph_separator
+                first = False
+                yield paragraph.text
     
     def export_simple(
         self,
@@ -94,16 +134,7 @@ class TxtExporter:
         output_path = Path(output_path)
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # 收集所有段落文本
-        all_paragraphs = []
-        for page in pages:
-            for paragraph in page.paragraphs:
-                all_paragraphs.append(paragraph.text)
-        
-        content = self.paragraph_separator.join(all_paragraphs)
-        
-        with open(output_path, "w", encoding=self.encoding) as f:
-            f.write(content)
+        self._write_chunks(output_path, self._iter_simple_chunks(pages))
         
         return output_path
 
@@ -5,29 +5,44 @@ FastAPI 应用入口
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse
 
 from contextlib import asynccontextmanager
 from app.config import settings
+from app.core.pool import (
+    PREPROCESS_WORKERS, PARSE_WORKERS, prestart_workers,
+    get_preprocess_pool, shutdown_preprocess_pool,
+    get_parse_pool, shutdown_parse_pool
+)
 from app.api import upload, ocr, export, tasks, history, ai
+from app.core.task_store import task_store
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """应用生命周期工作：启动时预热 OCR 引擎"""
+    """应用生命周期工作：启动时预热 OCR 引擎并启动预处理/解析进程池"""
     if settings.OCR_WARMUP:
         try:
-            from app.ocr.engine import OCREngine
+            from app.ocr.engine import get_engine
             # 初始化并预热
-            engine = OCREngine()
+            engine = get_engine()
             engine.warmup()
         except Exception as e:
             print(f"启动预热失败: {e}")
+    prestart_workers(get_preprocess_pool(), PREPROCESS_WORKERS)
+    prestart_workers(get_parse_pool(), PARSE_WORKERS)
     yield
+    shutdown_preprocess_pool()
+    shutdown_parse_pool()
+    # 关闭主事件循环上的 Redis 连接
+    for store in (task_store, upload.parse_store, ai.ai_store):
+        await store.aclose()
 
 app = FastAPI(
     title="SmartPDF-OCR",
     description="面向中文场景的智能 PDF OCR 系统",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # 配置 CORS
@@ -3,36 +3,36 @@ OCR 引擎模块
 封装 PaddleOCR 提供统一的 OCR 接口
 """
 
+import copy
+import asyncio
+import operator
+import threading
+from concurrent.futures import Future
 import numpy as np
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, Dict
 from dataclasses import dataclass, field
 from paddleocr import PaddleOCR
 
 from app.config import settings
 
 
-@dataclass
+@dataclass(slots=True)
 class OCRLine:
     """OCR 识别的单行文本"""
     text: str
     confidence: float
     box: List[List[float]]  # 四个角点坐标 [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
+    # 由 box 计算的几何属性，构造时算一次（排序、合并行、重建段落时会反复读取）
+    x_min: float = field(init=False, repr=False, compare=False)
+    x_max: float = field(init=False, repr=False, compare=False)
+    y_min: float = field(init=False, repr=False, compare=False)
+    y_max: float = field(init=False, repr=False, compare=False)
     
-    @property
-    def x_min(self) -> float:
-        return min(p[0] for p in self.box)
-    
-    @property
-    def x_max(self) -> float:
-        return max(p[0] for p in self.box)
-    
-    @property
-    def y_min(self) -> float:
-        return min(p[1] for p in self.box)
-    
-    @property
-    def y_max(self) -> float:
-        return max(p[1] for p in self.box)
+    def __post_init__(self):
+        xs = [p[0] for p in self.box]
+        ys = [p[1] for p in self.box]
+        self.x_min, self.x_max = min(xs), max(xs)
+        self.y_min, self.y_max = min(ys), max(ys)
     
     @property
     def height(self) -> float:
@@ -54,18 +54,25 @@ class OCRResult:
     lines: List[OCRLine] = field(default_factory=list)
     img_width: int = 0
     img_height: int = 0
+    # text/avg_confidence 的缓存（导出时会多次读取）；sort_by_position 时失效
+    _text: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _avg_confidence: Optional[float] = field(default=None, init=False, repr=False, compare=False)
     
     @property
     def text(self) -> str:
         """获取所有文本（按行拼接）"""
-        return "\n".join(line.text for line in self.lines)
+        if self._text is None:
+            self._text = "\n".join(line.text for line in self.lines)
+        return self._text
     
     @property
     def avg_confidence(self) -> float:
         """平均置信度"""
-        if not self.lines:
-            return 0.0
-        return sum(line.confidence for line in self.lines) / len(self.lines)
+        if self._avg_confidence is None:
+            if not self.lines:
+                return 0.0
+            self._avg_confidence = sum(line.confidence for line in self.lines) / len(self.lines)
+        return self._avg_confidence
     
     @property
     def low_confidence_lines(self) -> List[OCRLine]:
@@ -75,20 +82,49 @@ class OCRResult:
     
     def sort_by_position(self) -> None:
         """按位置排序（从上到下，从左到右）"""
-        self.lines.sort(key=lambda line: (line.y_min, line.x_min))
+        self.lines.sort(key=operator.attrgetter("y_min", "x_min"))
+        self._text = None
+        self._avg_confidence = None
 
 
 class OCREngine:
     """OCR 引擎"""
     
-    _instance: Optional['OCREngine'] = None
     _ocr: Optional[PaddleOCR] = None
+    # 引擎类型；PP-OCR 的检测/识别网络自带特征提取，外部去噪/二值化收益很小
+    kind = "paddle"
+    builtin_preprocess = True
+    # 已创建的引擎：(语言, 方向分类, GPU, TensorRT) -> 引擎
+    _engines: Dict[tuple, "OCREngine"] = {}
+    _engines_lock = threading.Lock()
     
-    def __new__(cls, *args, **kwargs):
-        """单例模式"""
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
+    @classmethod
+    def get(
+        cls,
+        lang: str = None,
+        use_angle_cls: bool = None,
+        use_gpu: bool = None,
+        use_tensorrt: bool = None
+    ) -> "OCREngine":
+        """
+        获取指定配置的共享引擎（每种配置只加载一次模型）
+        
+        参数为空时使用配置值；加锁保证并发的首次调用不会重复初始化 PaddleOCR
+        """
+        key = (
+            lang or settings.OCR_LANG,
+            use_angle_cls if use_angle_cls is not None else settings.OCR_USE_ANGLE_CLS,
+            use_gpu if use_gpu is not None else settings.OCR_USE_GPU,
+            use_tensorrt if use_tensorrt is not None else settings.OCR_USE_TENSORRT,
+        )
+        engine = cls._engines.get(key)
+        if engine is None:
+            with cls._engines_lock:
+                engine = cls._engines.get(key)
+                if engine is None:
+                    engine = cls(*key)
+                    cls._engines[key] = engine
+        return engine
     
     def __init__(
         self,
@@ -106,8 +142,11 @@ class OCREngine:
             use_gpu: 是否使用 GPU
             use_tensorrt: 是否使用 TensorRT
         """
-        if self._ocr is not None:
-            return
+        # PaddleOCR 预测器非线程安全，推理调用需串行；结果解析等可并发
+        self._infer_lock = threading.Lock()
+        # 等待推理的页面：(图像, 页码, Future)，取得推理锁的线程合并处理
+        self._pending: List[tuple] = []
+        self._pending_lock = threading.Lock()
         
         self.lang = lang or settings.OCR_LANG
         self.use_angle_cls = use_angle_cls if use_angle_cls is not None else settings.OCR_USE_ANGLE_CLS
@@ -139,7 +178,10 @@ class OCREngine:
         if not self.use_gpu:
             self.use_tensorrt = False
 
-        print(f"OCR 引擎初始化: GPU={self.use_gpu}, TensorRT={self.use_tensorrt}")
+        # 推理精度只在 TensorRT 下生效；int8 需使用量化模型
+        self.precision = settings.OCR_PRECISION if self.use_tensorrt else "fp32"
+
+        print(f"OCR 引擎初始化: GPU={self.use_gpu}, TensorRT={self.use_tensorrt}, 精度={self.precision}")
 
         # 捕获日志输出
         self._ocr = PaddleOCR(
@@ -147,19 +189,38 @@ class OCREngine:
             lang=self.lang,
             use_gpu=self.use_gpu,
             use_tensorrt=self.use_tensorrt,
+            precision=self.precision,
+            max_batch_size=settings.OCR_REC_BATCH_NUM,
+            min_subgraph_size=15,
+            enable_mkldnn=settings.OCR_ENABLE_MKLDNN,
+            cpu_threads=settings.OCR_CPU_THREADS,
+            rec_batch_num=settings.OCR_REC_BATCH_NUM,
             show_log=False
         )
 
     def warmup(self):
-        """引擎预热：执行一次虚拟识别以加载模型和初始化 GPU 环境"""
+        """
+        引擎预热：加载模型、初始化 GPU 环境，并按常见输入尺寸预先构建推理内核
+        
+        TensorRT 引擎与 MKL-DNN 算子都按输入尺寸构建，只用小图预热时，
+        首个整页（300 DPI A4 约 2480x3508）仍要重新构建，耗时数秒
+        """
+        import cv2
+        
         if self._ocr is None:
             self._init_ocr()
         
         print("正在预热 OCR 引擎...")
         try:
-            # 创建一个 100x100 的纯色图片进行预热
-            dummy_img = np.zeros((100, 100, 3), dtype=np.uint8)
-            self._ocr.ocr(dummy_img, cls=self.use_angle_cls)
+            # 带一行文字的白底图片，使检测、方向分类与识别网络都参与推理
+            images = []
+            for width, height in settings.OCR_WARMUP_SHAPES:
+                img = np.full((height, width, 3), 255, dtype=np.uint8)
+                cv2.putText(img, "OCR warmup 0123", (width // 32, height // 2),
+                            cv2.FONT_HERSHEY_SIMPLEX, width / 640, (0, 0, 0), 2)
+                images.append(img)
+            # 走与 OCR 任务相同的批量路径，识别网络按批次尺寸预热
+            self.recognize_batch(images)
             print("OCR 引擎预热完成")
         except Exception as e:
             print(f"OCR 引擎预热失败: {e}")
@@ -179,7 +240,8 @@ class OCREngine:
             self._init_ocr()
         
         # 执行 OCR
-        result = self._ocr.ocr(image, cls=self.use_angle_cls)
+        with self._infer_lock:
+            result = self._ocr.ocr(image, cls=self.use_angle_cls)
         
         # 解析结果
         lines = []
@@ -206,13 +268,141 @@ class OCREngine:
         
         return ocr_result
     
+    async def recognize_async(self, image: np.ndarray, page_num: int = 0) -> OCRResult:
+        """
+        异步识别图片中的文字（在线程中执行，不阻塞事件循环）
+        
+        并发提交的多页会在推理时合并为一批（见 _recognize_coalesced）
+        
+        Args:
+            image: 输入图像 (numpy 数组)
+            page_num: 页码
+            
+        Returns:
+            OCRResult 对象
+        """
+        return await asyncio.to_thread(self._recognize_coalesced, image, page_num)
+    
+    def _recognize_coalesced(self, image: np.ndarray, page_num: int) -> OCRResult:
+        """
+        排队识别单页
+        
+        推理本身是串行的：等待推理锁期间到达的页面，由下一个取得锁的线程
+        一次取出（最多 OCR_BATCH_SIZE 页）合并识别，其余线程直接拿结果。
+        检测完成后即释放推理锁，裁剪文本行期间下一批可以开始检测
+        """
+        # 灰度转换在锁外完成
+        image = self._to_bgr(image)
+        future: Future = Future()
+        with self._pending_lock:
+            self._pending.append((image, page_num, future))
+        
+        while not future.done():
+            with self._infer_lock:
+                if future.done():
+                    break
+                with self._pending_lock:
+                    batch = self._pending[:max(settings.OCR_BATCH_SIZE, 1)]
+                    del self._pending[:len(batch)]
+                if not batch:
+                    # 本页已被另一线程取走，等待其结果
+                    break
+                try:
+                    page_boxes = self._detect_locked([item[0] for item in batch])
+                except Exception as e:
+                    for _, _, pending in batch:
+                        pending.set_exception(e)
+                    continue
+            try:
+                results = self._recognize_detected([item[0] for item in batch], page_boxes)
+            except Exception as e:
+                for _, _, pending in batch:
+                    pending.set_exception(e)
+                continue
+            for (img, p_num, pending), lines in zip(batch, results):
+                pending.set_result(self._build_result(lines, img, p_num))
+        return future.result()
+    
+    @staticmethod
+    def _build_result(lines: List[OCRLine], image: np.ndarray, page_num: int) -> OCRResult:
+        ocr_result = OCRResult(
+            page_num=page_num,
+            lines=lines,
+            img_width=image.shape[1],
+            img_height=image.shape[0]
+        )
+        ocr_result.sort_by_position()
+        return ocr_result
+    
+    @staticmethod
+    def _to_bgr(image: np.ndarray) -> np.ndarray:
+        """二值化/灰度图转为 3 通道（与 PaddleOCR.ocr 的输入检查一致）"""
+        if image.ndim == 2:
+            import cv2
+            return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        return image
+    
+    def _detect_locked(self, images: List[np.ndarray]) -> List[list]:
+        """逐页检测文本框并按阅读顺序排序（调用方需持有推理锁）"""
+        from tools.infer.predict_system import sorted_boxes
+        
+        if self._ocr is None:
+            self._init_ocr()
+        
+        page_boxes = []
+        for image in images:
+            dt_boxes, _ = self._ocr.text_detector(image)
+            page_boxes.append(sorted_boxes(dt_boxes) if dt_boxes is not None else [])
+        return page_boxes
+    
+    def _recognize_detected(
+        self,
+        images: List[np.ndarray],
+        page_boxes: List[list]
+    ) -> List[List[OCRLine]]:
+        """
+        识别已检测的文本框
+        
+        所有页面的文本行裁剪（不持锁）合并后，统一做方向分类与识别，
+        识别网络按 rec_batch_num 成批推理，少行页面也能填满批次。
+        整体流程与 PaddleOCR 的 TextSystem.__call__ 一致
+        """
+        from tools.infer.utility import get_rotate_crop_image, get_minarea_rect_crop
+        
+        box_type = getattr(self._ocr.args, "det_box_type", "quad")
+        crop = get_rotate_crop_image if box_type == "quad" else get_minarea_rect_crop
+        crops = [
+            crop(image, copy.deepcopy(box))
+            for image, dt_boxes in zip(images, page_boxes)
+            for box in dt_boxes
+        ]
+        
+        rec_res = []
+        if crops:
+            with self._infer_lock:
+                if self.use_angle_cls:
+                    crops, _, _ = self._ocr.text_classifier(crops)
+                rec_res, _ = self._ocr.text_recognizer(crops)
+        
+        # 按页拆分识别结果，过滤低于 drop_score 的行
+        results = []
+        offset = 0
+        for dt_boxes in page_boxes:
+            lines = []
+            for box, (text, confidence) in zip(dt_boxes, rec_res[offset:offset + len(dt_boxes)]):
+                if confidence >= self._ocr.drop_score:
+                    lines.append(OCRLine(text=text, confidence=confidence, box=box.tolist()))
+            offset += len(dt_boxes)
+            results.append(lines)
+        return results
+    
     def recognize_batch(
         self, 
         images: List[np.ndarray],
         start_page: int = 0
     ) -> List[OCRResult]:
         """
-        批量识别多张图片
+        批量识别多张图片（各页文本行合并后成批识别）
         
         Args:
             images: 图片列表
@@ -221,11 +411,14 @@ class OCREngine:
         Returns:
             OCRResult 对象列表
         """
-        results = []
-        for i, image in enumerate(images):
-            result = self.recognize(image, page_num=start_page + i)
-            results.append(result)
-        return results
+        images = [self._to_bgr(image) for image in images]
+        with self._infer_lock:
+            page_boxes = self._detect_locked(images)
+        batch_lines = self._recognize_detected(images, page_boxes)
+        return [
+            self._build_result(lines, image, start_page + i)
+            for i, (image, lines) in enumerate(zip(images, batch_lines))
+        ]
     
     def get_text_only(self, image: np.ndarray) -> str:
         """
@@ -241,6 +434,11 @@ class OCREngine:
         return result.text
 
 
+def get_engine() -> OCREngine:
+    """获取按配置创建的全局共享 OCR 引擎"""
+    return OCREngine.get()
+
+
 def recognize_image(image: np.ndarray) -> OCRResult:
     """
     快捷函数：识别图片
@@ -251,7 +449,7 @@ def recognize_image(image: np.ndarray) -> OCRResult:
     Returns:
         OCRResult 对象
     """
-    engine = OCREngine()
+    engine = get_engine()
     return engine.recognize(image)
 
 
@@ -265,5 +463,5 @@ def get_text(image: np.ndarray) -> str:
     Returns:
         识别的文本
     """
-    engine = OCREngine()
+    engine = get_engine()
     return engine.get_text_only(image)
@@ -4,6 +4,7 @@ OCR 后处理模块
 """
 
 import re
+import operator
 from typing import List, Dict, Tuple, Optional
 from dataclasses import dataclass
 from collections import Counter
@@ -11,6 +12,27 @@ from collections import Counter
 from app.config import settings
 from app.ocr.engine import OCRResult, OCRLine
 
+# 段落开头：缩进（4 个空格或制表符），或去掉前导空白后是列表项
+_PARAGRAPH_START_RE = re.compile(
+    r"(?: {4}|\t)"
+    r"|\s*(?:"
+    r"\d+[.、）)]"  # 1. 1、 1）1)
+    r"|[一二三四五六七八九十]+[.、）)]"  # 一、二、
+    r"|[（(]\d+[）)]"  # (1) （1）
+    r"|[•·▪▸►◆○●■□]"  # 各种符号列表
+    r")"
+)
+
+# format_text 使用的正则与单字符修正表
+_CN_PUNCT_SPACE_RE = re.compile(r'([，。！？；：、])\s+')
+_EN_PUNCT_LETTER_RE = re.compile(r'([,.:;!?])([a-zA-Z])')
+_MULTI_SPACE_RE = re.compile(r' {2,}')
+_OCR_CORRECTIONS = str.maketrans({
+    '囗': '□',
+    '〇': '○',
+    '―': '—',
+})
+
 
 @dataclass
 class Paragraph:
@@ -89,7 +111,7 @@ class PostProcessor:
             lines = self._filter_by_margins(lines, ocr_result.img_width, ocr_result.img_height)
         
         # 排序
-        lines.sort(key=lambda x: (x.y_min, x.x_min))
+        lines.sort(key=operator.attrgetter("y_min", "x_min"))
         
         # 合并同行文本
         merged_lines = self._merge_same_row_lines(lines)
@@ -170,37 +192,54 @@ class PostProcessor:
             return []
         
         merged = []
-        current_line = lines[0]
-        current_texts = [current_line.text]
-        current_boxes = [current_line.box]
-        current_confidences = [current_line.confidence]
+        group = [lines[0]]
+        # 当前行首块的 y 范围与高度；后续块都与它比较
+        top, bottom = lines[0].y_min, lines[0].y_max
+        height = bottom - top
         
         for line in lines[1:]:
-            # 判断是否在同一行（y 坐标重叠）
-            overlap = self._calculate_y_overlap(current_line, line)
-            
-            if overlap > 0.5:  # 重叠超过 50% 认为是同一行
-                current_texts.append(line.text)
-                current_boxes.append(line.box)
-                current_confidences.append(line.confidence)
+            # 判断是否在同一行（y 坐标重叠超过较矮一块高度的 50%，
+            # 同 _calculate_y_overlap，内联并改写为乘法比较）。
+            # 重叠为正时两块高度必然为正，无需再检查除数
+            y_min, y_max = line.y_min, line.y_max
+            overlap = (bottom if bottom < y_max else y_max) - (top if top > y_min else y_min)
+            if overlap > 0 and 2 * overlap > min(height, y_max - y_min):
+                group.append(line)
             else:
-                # 保存当前行
-                merged.append(self._create_merged_line(
-                    current_texts, current_boxes, current_confidences
-                ))
-                # 开始新行
-                current_line = line
-                current_texts = [line.text]
-                current_boxes = [line.box]
-                current_confidences = [line.confidence]
+                # 保存当前行，开始新行
+                merged.append(self._merge_group(group))
+                group = [line]
+                top, bottom = y_min, y_max
+                height = bottom - top
         
         # 保存最后一行
-        merged.append(self._create_merged_line(
-            current_texts, current_boxes, current_confidences
-        ))
+        merged.append(self._merge_group(group))
         
         return merged
     
+    @staticmethod
+    def _merge_group(group: List[OCRLine]) -> OCRLine:
+        """
+        合并同一行的文本块
+        
+        边界框直接取各块构造时算好的 x_min/x_max/y_min/y_max，
+        不再展开全部角点反复求最值
+        """
+        # 平均置信度（按原顺序累加）
+        avg_confidence = sum(line.confidence for line in group) / len(group)
+        if len(group) > 1:
+            # 按首个角点的 x 坐标排序
+            group = sorted(group, key=lambda line: line.box[0][0])
+        x_min = min(line.x_min for line in group)
+        x_max = max(line.x_max for line in group)
+        y_min = min(line.y_min for line in group)
+        y_max = max(line.y_max for line in group)
+        return OCRLine(
+            text=" ".join(line.text for line in group),
+            confidence=avg_confidence,
+            box=[[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]]
+        )
+    
     def _calculate_y_overlap(self, line1: OCRLine, line2: OCRLine) -> float:
         """计算两行在 y 轴上的重叠比例"""
         y1_min, y1_max = line1.y_min, line1.y_max
@@ -220,96 +259,39 @@ class PostProcessor:
         
         return overlap_height / min_height
     
-    def _create_merged_line(
-        self,
-        texts: List[str],
-        boxes: List[List[List[float]]],
-        confidences: List[float]
-    ) -> OCRLine:
-        """创建合并后的行"""
-        # 按 x 坐标排序
-        items = sorted(zip(texts, boxes, confidences), key=lambda x: x[1][0][0])
-        
-        # 合并文本
-        merged_text = " ".join(t for t, _, _ in items)
-        
-        # 合并边界框
-        all_points = [p for _, box, _ in items for p in box]
-        merged_box = [
-            [min(p[0] for p in all_points), min(p[1] for p in all_points)],
-            [max(p[0] for p in all_points), min(p[1] for p in all_points)],
-            [max(p[0] for p in all_points), max(p[1] for p in all_points)],
-            [min(p[0] for p in all_points), max(p[1] for p in all_points)]
-        ]
-        
-        # 平均置信度
-        avg_confidence = sum(confidences) / len(confidences)
-        
-        return OCRLine(
-            text=merged_text,
-            confidence=avg_confidence,
-            box=merged_box
-        )
-    
     def _rebuild_paragraphs(self, lines: List[OCRLine]) -> List[Paragraph]:
         """重建段落"""
         if not lines:
             return []
         
-        paragraphs = []
-        current_lines = [lines[0]]
-        
-        # 计算平均行高
+        # 计算平均行高与段间距阈值
         avg_height = sum(line.height for line in lines) / len(lines)
+        gap_limit = avg_height * self.line_spacing_threshold
+        is_paragraph_start = self._is_paragraph_start
+        
+        # 一次扫描找出所有新段落的起始行：行间距超过阈值，或是缩进/列表项
+        starts = [
+            i for i, (prev_line, curr_line) in enumerate(zip(lines, lines[1:]), 1)
+            if curr_line.y_min - prev_line.y_max > gap_limit
+            or is_paragraph_start(curr_line.text)
+        ]
         
-        for i in range(1, len(lines)):
-            prev_line = lines[i - 1]
-            curr_line = lines[i]
-            
-            # 计算行间距
-            line_gap = curr_line.y_min - prev_line.y_max
-            
-            # 判断是否是新段落
-            is_new_paragraph = (
-                line_gap > avg_height * self.line_spacing_threshold or
-                self._is_paragraph_start(curr_line.text)
-            )
-            
-            if is_new_paragraph:
-                # 保存当前段落
-                paragraphs.append(self._create_paragraph(current_lines))
-                current_lines = [curr_line]
-            else:
-                current_lines.append(curr_line)
-        
-        # 保存最后一个段落
-        if current_lines:
-            paragraphs.append(self._create_paragraph(current_lines))
+        # 按起始行切分段落
+        bounds = [0, *starts, len(lines)]
+        paragraphs = [
+            self._create_paragraph(lines[start:end])
+            for start, end in zip(bounds, bounds[1:])
+        ]
         
         return paragraphs
     
     def _is_paragraph_start(self, text: str) -> bool:
         """判断是否是段落开头"""
-        # 检查是否有缩进（以空格开头）
-        if text.startswith("    ") or text.startswith("\t"):
-            return True
-        
-        # 检查是否是列表项
-        list_patterns = [
-            r"^\d+[.、）)]",  # 1. 1、 1）1)
-            r"^[一二三四五六七八九十]+[.、）)]",  # 一、二、
-            r"^[（(]\d+[）)]",  # (1) （1）
-            r"^[•·▪▸►◆○●■□]",  # 各种符号列表
-        ]
-        for pattern in list_patterns:
-            if re.match(pattern, text.strip()):
-                return True
-        
-        return False
+        return _PARAGRAPH_START_RE.match(text) is not None
     
     def _create_paragraph(self, lines: List[OCRLine]) -> Paragraph:
         """创建段落"""
-        text = "".join(line.text for line in lines)
+        text = "".join([line.text for line in lines])
         return Paragraph(text=text, lines=lines)
     
     def _remove_headers_footers(
@@ -320,18 +302,16 @@ class PostProcessor:
         if len(pages) < self.header_footer_repeat_threshold:
             return pages
         
-        # 收集每页首尾段落
-        first_paragraphs = []
-        last_paragraphs = []
-        
-        for page in pages:
-            if page.paragraphs:
-                first_paragraphs.append(page.paragraphs[0].text.strip())
-                last_paragraphs.append(page.paragraphs[-1].text.strip())
+        # 收集每页首尾段落（strip 结果在下面的匹配中复用）
+        edges = [
+            (page.paragraphs[0].text.strip(), page.paragraphs[-1].text.strip())
+            if page.paragraphs else None
+            for page in pages
+        ]
         
         # 统计重复内容
-        first_counter = Counter(first_paragraphs)
-        last_counter = Counter(last_paragraphs)
+        first_counter = Counter(e[0] for e in edges if e is not None)
+        last_counter = Counter(e[1] for e in edges if e is not None)
         
         # 识别页眉页脚
         headers = {
@@ -342,19 +322,24 @@ class PostProcessor:
             text for text, count in last_counter.items() 
             if count >= self.header_footer_repeat_threshold
         }
+        if not headers and not footers:
+            return pages
         
         # 移除页眉页脚
-        for page in pages:
-            if page.paragraphs:
-                # 移除页眉
-                if page.paragraphs[0].text.strip() in headers:
-                    page.header = page.paragraphs[0].text
-                    page.paragraphs = page.paragraphs[1:]
-                
-                # 移除页脚
-                if page.paragraphs and page.paragraphs[-1].text.strip() in footers:
-                    page.footer = page.paragraphs[-1].text
-                    page.paragraphs = page.paragraphs[:-1]
+        for page, edge in zip(pages, edges):
+            if edge is None:
+                continue
+            first, last = edge
+            
+            # 移除页眉
+            if first in headers:
+                page.header = page.paragraphs[0].text
+                page.paragraphs = page.paragraphs[1:]
+            
+            # 移除页脚（移除页眉后末段仍是原末段，除非页面已空）
+            if page.paragraphs and last in footers:
+                page.footer = page.paragraphs[-1].text
+                page.paragraphs = page.paragraphs[:-1]
         
         return pages
 
@@ -380,22 +365,15 @@ def format_text(text: str) -> str:
     - 修正常见 OCR 错误
     """
     # 中文标点后不应有空格
-    text = re.sub(r'([，。！？；：、])(\s+)', r'\1', text)
+    text = _CN_PUNCT_SPACE_RE.sub(r'\1', text)
     
     # 英文标点后应有空格（如果后面是字母）
-    text = re.sub(r'([,.:;!?])([a-zA-Z])', r'\1 \2', text)
+    text = _EN_PUNCT_LETTER_RE.sub(r'\1 \2', text)
     
     # 规范化连续空格
-    text = re.sub(r' +', ' ', text)
+    text = _MULTI_SPACE_RE.sub(' ', text)
     
     # 常见 OCR 错误修正
-    corrections = {
-        '囗': '口',
-        '囗': '□',
-        '〇': '○',
-        '―': '—',
-    }
-    for wrong, right in corrections.items():
-        text = text.replace(wrong, right)
+    text = text.translate(_OCR_CORRECTIONS)
     
     return text.strip()
@@ -5,6 +5,7 @@
 from .denoise import denoise, gaussian_denoise, median_denoise, bilateral_denoise
 from .binarize import binarize, otsu_binarize, adaptive_binarize
 from .deskew import deskew, detect_skew_angle
+from ._common import ensure_grayscale
 
 __all__ = [
     "denoise",
@@ -15,5 +16,6 @@ __all__ = [
     "otsu_binarize",
     "adaptive_binarize",
     "deskew",
-    "detect_skew_angle"
+    "detect_skew_angle",
+    "ensure_grayscale"
 ]
@@ -0,0 +1,13 @@
+"""
+预处理公共函数
+"""
+
+import numpy as np
+import cv2
+
+
+def ensure_grayscale(image: np.ndarray) -> np.ndarray:
+    """确保图像是灰度图（已是单通道时原样返回，不复制）"""
+    if len(image.shape) == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
@@ -7,12 +7,7 @@ import numpy as np
 import cv2
 from typing import Literal, Tuple
 
-
-def _ensure_grayscale(image: np.ndarray) -> np.ndarray:
-    """确保图像是灰度图"""
-    if len(image.shape) == 3:
-        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    return image
+from ._common import ensure_grayscale
 
 
 def simple_binarize(
@@ -33,7 +28,7 @@ def simple_binarize(
     Returns:
         二值化后的图像
     """
-    gray = _ensure_grayscale(image)
+    gray = ensure_grayscale(image)
     
     thresh_type = cv2.THRESH_BINARY_INV if invert else cv2.THRESH_BINARY
     _, binary = cv2.threshold(gray, threshold, max_value, thresh_type)
@@ -58,7 +53,7 @@ def otsu_binarize(
     Returns:
         (二值化图像, 计算得到的阈值)
     """
-    gray = _ensure_grayscale(image)
+    gray = ensure_grayscale(image)
     
     thresh_type = cv2.THRESH_BINARY_INV if invert else cv2.THRESH_BINARY
     thresh_type |= cv2.THRESH_OTSU
@@ -93,7 +88,7 @@ def adaptive_binarize(
     Returns:
         二值化后的图像
     """
-    gray = _ensure_grayscale(image)
+    gray = ensure_grayscale(image)
     
     # 确保 block_size 是奇数
     if block_size % 2 == 0:
@@ -132,19 +127,28 @@ def sauvola_binarize(
     Returns:
         二值化后的图像
     """
-    gray = _ensure_grayscale(image).astype(np.float64)
-    
-    # 计算局部均值和标准差
-    mean = cv2.blur(gray, (window_size, window_size))
-    mean_sq = cv2.blur(gray * gray, (window_size, window_size))
-    std = np.sqrt(mean_sq - mean * mean)
-    
-    # Sauvola 阈值
-    threshold = mean * (1 + k * (std / r - 1))
-    
-    # 二值化
-    binary = np.zeros_like(gray, dtype=np.uint8)
-    binary[gray > threshold] = 255
+    gray = ensure_grayscale(image).astype(np.float32)
+    
+    # 计算局部均值和标准差（float32 对 0-255 的像素足够，内存为 float64 的一半）
+    # 后续运算都写回已有缓冲区，整页只分配这几块 float32 数组
+    ksize = (window_size, window_size)
+    mean = cv2.blur(gray, ksize)
+    std = cv2.multiply(gray, gray)
+    cv2.blur(std, ksize, dst=std)
+    np.subtract(std, mean * mean, out=std)
+    np.maximum(std, 0, out=std)
+    np.sqrt(std, out=std)
+    
+    # Sauvola 阈值：mean * (1 + k * (std / r - 1))，在 std 缓冲区上原地计算
+    threshold = std
+    threshold /= r
+    threshold -= 1
+    threshold *= k
+    threshold += 1
+    threshold *= mean
+    
+    # 二值化（cv2.compare 直接输出 0/255 的 uint8）
+    binary = cv2.compare(gray, threshold, cv2.CMP_GT)
     
     return binary
 
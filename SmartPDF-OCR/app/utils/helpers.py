@@ -2,11 +2,14 @@
 通用工具函数
 """
 
+import re
 import time
+import asyncio
 import functools
 from typing import Callable, Any
 from pathlib import Path
 import logging
+import orjson
 
 # 配置日志
 logging.basicConfig(
@@ -15,15 +18,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger("SmartPDF-OCR")
 
+# 文件名中不允许出现的字符
+_UNSAFE_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*]')
+# 文件大小单位（按 1024 进位）
+_SIZE_UNITS = ("B", "KB", "MB", "GB")
+
 
 def timer(func: Callable) -> Callable:
     """计时装饰器"""
     @functools.wraps(func)
     def wrapper(*args, **kwargs) -> Any:
-        start = time.time()
+        # 日志级别高于 INFO 时不计时、不格式化
+        if not logger.isEnabledFor(logging.INFO):
+            return func(*args, **kwargs)
+        start = time.perf_counter_ns()
         result = func(*args, **kwargs)
-        elapsed = time.time() - start
-        logger.info(f"{func.__name__} 耗时: {elapsed:.2f}s")
+        elapsed = (time.perf_counter_ns() - start) / 1e9
+        logger.info("%s 耗时: %.2fs", func.__name__, elapsed)
         return result
     return wrapper
 
@@ -35,23 +46,42 @@ def ensure_dir(path: Path | str) -> Path:
     return path
 
 
+def read_json(path: Path | str) -> Any:
+    """读取 JSON 文件"""
+    return orjson.loads(Path(path).read_bytes())
+
+
+def write_json(path: Path | str, data: Any, indent: bool = False) -> None:
+    """写入 JSON 文件（UTF-8，默认紧凑格式以减小体积、加快读写）"""
+    option = orjson.OPT_SERIALIZE_NUMPY
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    Path(path).write_bytes(orjson.dumps(data, option=option))
+
+
+async def aread_json(path: Path | str) -> Any:
+    """在线程中读取 JSON 文件，避免阻塞事件循环"""
+    return await asyncio.to_thread(read_json, path)
+
+
+async def awrite_json(path: Path | str, data: Any, indent: bool = False) -> None:
+    """在线程中写入 JSON 文件，避免阻塞事件循环"""
+    await asyncio.to_thread(write_json, path, data, indent)
+
+
 def get_file_size_str(size_bytes: int) -> str:
     """将字节大小转换为可读字符串"""
     if size_bytes < 1024:
         return f"{size_bytes} B"
-    elif size_bytes < 1024 * 1024:
-        return f"{size_bytes / 1024:.1f} KB"
-    elif size_bytes < 1024 * 1024 * 1024:
-        return f"{size_bytes / (1024 * 1024):.1f} MB"
-    else:
-        return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
+    # 每 10 个二进制位进一级，最大到 GB
+    unit = min((int(size_bytes).bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+    return f"{size_bytes / (1 << (10 * unit)):.1f} {_SIZE_UNITS[unit]}"
 
 
 def safe_filename(filename: str) -> str:
     """生成安全的文件名"""
-    import re
     # 移除不安全字符
-    safe = re.sub(r'[<>:"/\\|?*]', '_', filename)
+    safe = _UNSAFE_FILENAME_CHARS.sub('_', filename)
     # 移除开头和结尾的空格和点
     safe = safe.strip(' .')
     # 限制长度
@@ -0,0 +1,65 @@
+"""
+Server-Sent Events 工具
+将任务状态存储中的状态变化以 text/event-stream 推送给客户端
+"""
+
+import asyncio
+from typing import Dict, Any, Iterable, AsyncIterator
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+# 无状态变化时的心跳间隔（秒），同时作为读取其他进程写入状态的兜底
+KEEPALIVE_INTERVAL = 15
+
+
+async def _status_events(
+    store,
+    task_id: str,
+    fields: Iterable[str],
+    default: Dict[str, Any],
+    terminal: Iterable[str]
+) -> AsyncIterator[bytes]:
+    fields = tuple(fields)
+    terminal = frozenset(terminal)
+    last = None
+    with store.subscribe(task_id) as changed:
+        while True:
+            changed.clear()
+            status = await store.get_status(task_id) or default
+            snapshot = {k: status.get(k) for k in fields}
+            if snapshot != last:
+                last = snapshot
+                yield b"data: " + orjson.dumps(snapshot, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n\n"
+                if snapshot.get("status") in terminal:
+                    return
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+
+
+def status_event_response(
+    store,
+    task_id: str,
+    fields: Iterable[str],
+    default: Dict[str, Any],
+    terminal: Iterable[str] = ("completed", "failed")
+) -> StreamingResponse:
+    """
+    推送任务状态变化
+
+    仅在所选字段变化时推送，状态进入 terminal 后结束
+
+    Args:
+        store: 任务状态存储（TaskStore）
+        task_id: 任务 ID
+        fields: 推送的状态字段
+        default: 尚无状态时使用的默认值
+        terminal: 结束推送的状态值
+    """
+    return StreamingResponse(
+        _status_events(store, task_id, fields, default, terminal),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
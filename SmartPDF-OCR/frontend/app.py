@@ -3,37 +3,63 @@ Gradio 前端界面
 """
 
 import gradio as gr
-import requests
+import httpx
+import aiofiles
 import time
 import os
-import json
+import orjson
+from collections import OrderedDict
 from pathlib import Path
 
 # 配置 API 地址
 API_HOST = "http://127.0.0.1:8000"
 API_URL = f"{API_HOST}/api"
 
-def upload_pdf(file):
+# 共享异步客户端：复用到后端的 keep-alive 连接；
+# 处理函数均为协程，在 Gradio 的事件循环中交错执行，不占用工作线程
+ASYNC_CLIENT = httpx.AsyncClient(
+    timeout=30,
+    limits=httpx.Limits(max_keepalive_connections=8)
+)
+# 同时处理的事件数（Gradio 默认每个事件只允许 1 个并发）
+QUEUE_CONCURRENCY = 8
+# 排队等待的事件上限，超出时直接提示繁忙
+QUEUE_MAX_SIZE = 64
+# 界面主题（模块加载时构建一次）
+THEME = gr.themes.Soft()
+# 下载导出文件时的分块大小
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+# 进度刷新的最小间隔（秒）
+UI_UPDATE_INTERVAL = 0.05
+# 结果预览缓存：task_id -> 格式化后的文本（保留最近 RESULT_CACHE_SIZE 个任务）
+RESULT_CACHE_SIZE = 16
+_RESULT_CACHE: "OrderedDict[str, str]" = OrderedDict()
+
+async def upload_pdf(file):
     """上传 PDF 文件"""
     if file is None:
         return None, "请选择文件"
     
     url = f"{API_URL}/upload"
-    files = {"file": open(file, "rb")}
     
     try:
-        response = requests.post(url, files=files)
+        # multipart 请求体按块从磁盘读取，不把整个 PDF 读进内存
+        with open(file, "rb") as f:
+            response = await ASYNC_CLIENT.post(url, files={"file": f})
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         return data["task_id"], f"上传成功: {data['filename']} ({data['pdf_type']})"
     except Exception as e:
         return None, f"上传失败: {str(e)}"
 
-def start_ocr_process(task_id, preprocess, denoise, binarize, deskew, dpi):
+async def start_ocr_process(task_id, preprocess, denoise, binarize, deskew, dpi):
     """启动 OCR 处理"""
     if not task_id:
         return "请先上传文件"
     
+    # 重新识别会产生新结果
+    _RESULT_CACHE.pop(task_id, None)
+    
     url = f"{API_URL}/ocr/{task_id}"
     data = {
         "preprocess": preprocess,
@@ -44,65 +70,107 @@ def start_ocr_process(task_id, preprocess, denoise, binarize, deskew, dpi):
     }
     
     try:
-        response = requests.post(url, json=data)
+        response = await ASYNC_CLIENT.post(url, json=data)
         response.raise_for_status()
         return "OCR 任务已启动，请等待处理完成..."
     except Exception as e:
         return f"启动失败: {str(e)}"
 
-def check_status(task_id):
-    """检查任务状态"""
-    if not task_id:
-        return "未开始", 0, ""
-    
-    url = f"{API_URL}/ocr/{task_id}/status"
-    
+# 预处理选项的显示名称
+_PREPROCESS_LABELS = {"denoise": "去噪", "binarize": "二值化", "deskew": "倾斜校正"}
+
+async def load_engine_info():
+    """隐藏对当前 OCR 引擎不生效的预处理选项（去噪、二值化）"""
     try:
-        response = requests.get(url)
+        response = await ASYNC_CLIENT.get(f"{API_URL}/ocr/engine")
         response.raise_for_status()
-        data = response.json()
-        
-        status_text = f"状态: {data['status']}\n消息: {data['message']}"
-        if data['status'] == "processing":
-            status_text += f"\n当前页: {data['current_page']}/{data['total_pages']}"
-            
-        return status_text, data['progress'], data['status']
-    except Exception as e:
-        return f"查询失败: {str(e)}", 0, "error"
+        ignored = set(orjson.loads(response.content)["ignored_options"])
+    except Exception:
+        # 后端未就绪时保持原样
+        return gr.update(), gr.update()
+    return tuple(
+        gr.update(visible=False, value=False) if name in ignored else gr.update()
+        for name in ("denoise", "binarize")
+    )
+
+def _format_status(data):
+    """格式化任务状态文本"""
+    status_text = f"状态: {data['status']}\n消息: {data['message']}"
+    if data['status'] == "processing":
+        status_text += f"\n当前页: {data['current_page']}/{data['total_pages']}"
+    options = data.get('effective_options')
+    if options:
+        if options.get('preprocess'):
+            steps = [label for key, label in _PREPROCESS_LABELS.items() if options.get(key)]
+            status_text += f"\n预处理: {'、'.join(steps) or '无'}"
+        else:
+            status_text += "\n预处理: 未启用"
+    return status_text
+
+async def stream_status(task_id):
+    """
+    订阅任务进度（SSE）
+    
+    后端只在状态变化时推送，任务完成或失败后结束；逐条产出 (状态文本, 进度, 状态)
+    """
+    url = f"{API_URL}/ocr/{task_id}/events"
+    # 后端每 15 秒发送一次心跳，读超时设得更长
+    timeout = httpx.Timeout(30, read=60)
+    async with ASYNC_CLIENT.stream("GET", url, timeout=timeout) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = orjson.loads(line[5:])
+            yield _format_status(data), data['progress'], data['status']
 
-def get_ocr_result(task_id):
-    """获取 OCR 结果预览"""
+async def get_ocr_result(task_id, cache_result=False):
+    """
+    获取 OCR 结果预览
+    
+    cache_result 为真时缓存格式化后的文本；只应在确认是本次识别完成的结果时使用
+    """
     if not task_id:
         return "暂无结果"
     
+    # 已完成任务的结果不会再变化，直接复用格式化好的文本
+    cached = _RESULT_CACHE.get(task_id)
+    if cached is not None:
+        _RESULT_CACHE.move_to_end(task_id)
+        return cached
+    
     url = f"{API_URL}/ocr/{task_id}/result"
     
     try:
-        response = requests.get(url)
+        response = await ASYNC_CLIENT.get(url)
         if response.status_code != 200:
             return "任务尚未完成或出错"
             
-        data = response.json()
+        data = orjson.loads(response.content)
         
-        # 格式化显示
+        # 格式化显示（各段先收集到列表，最后一次拼接）
         if data.get("type") == "text":
-            return data.get("content", "")
-        
-        result_text = ""
-        if "pages" in data:
-            for page in data["pages"]:
-                result_text += f"--- 第 {page['page'] + 1} 页 ---\n\n"
+            result_text = data.get("content", "")
+        else:
+            parts = []
+            for page in data.get("pages", ()):
+                parts.append(f"--- 第 {page['page'] + 1} 页 ---\n\n")
                 if "paragraphs" in page:
-                    result_text += "\n\n".join(page["paragraphs"])
+                    parts.append("\n\n".join(page["paragraphs"]))
                 else:
-                    result_text += page.get("text", "")
-                result_text += "\n\n"
-                
+                    parts.append(page.get("text", ""))
+                parts.append("\n\n")
+            result_text = "".join(parts)
+        
+        if cache_result:
+            _RESULT_CACHE[task_id] = result_text
+            if len(_RESULT_CACHE) > RESULT_CACHE_SIZE:
+                _RESULT_CACHE.popitem(last=False)
         return result_text
     except Exception as e:
         return f"获取结果失败: {str(e)}"
 
-def export_result(task_id, format_type):
+async def export_result(task_id, format_type):
     """导出结果"""
     if not task_id:
         return None, "请先完成 OCR 处理"
@@ -111,9 +179,9 @@ def export_result(task_id, format_type):
     data = {"format": format_type, "include_page_numbers": True}
     
     try:
-        response = requests.post(url, json=data)
+        response = await ASYNC_CLIENT.post(url, json=data)
         response.raise_for_status()
-        res_data = response.json()
+        res_data = orjson.loads(response.content)
         
         filename = res_data["filename"]
         download_url = f"{API_URL}/export/{task_id}/download/{filename}"
@@ -122,16 +190,19 @@ def export_result(task_id, format_type):
         local_path = Path("outputs") / filename
         local_path.parent.mkdir(exist_ok=True)
         
-        file_res = requests.get(download_url)
-        with open(local_path, "wb") as f:
-            f.write(file_res.content)
+        # 流式写入，不把整个文件读进内存
+        async with ASYNC_CLIENT.stream("GET", download_url) as file_res:
+            file_res.raise_for_status()
+            async with aiofiles.open(local_path, "wb") as f:
+                async for chunk in file_res.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    await f.write(chunk)
             
         return str(local_path), f"导出成功: {filename}"
     except Exception as e:
         return None, f"导出失败: {str(e)}"
 
 # 构建 Gradio 界面
-with gr.Blocks(title="SmartPDF-OCR") as demo:
+with gr.Blocks(title="SmartPDF-OCR", analytics_enabled=False) as demo:
     gr.Markdown("# SmartPDF-OCR 智能文档识别系统")
     
     # 状态存储
@@ -159,9 +230,6 @@ with gr.Blocks(title="SmartPDF-OCR") as demo:
             progress_bar = gr.Slider(label="处理进度", minimum=0, maximum=100, value=0, interactive=False)
             status_box = gr.TextArea(label="任务状态", interactive=False, lines=4)
             
-            # 自动刷新组件
-            timer = gr.Timer(value=2.0, active=False)
-            
         with gr.Column(scale=2):
             # 结果预览
             result_preview = gr.TextArea(label="OCR 识别结果预览", lines=20, interactive=False)
@@ -181,35 +249,38 @@ with gr.Blocks(title="SmartPDF-OCR") as demo:
         outputs=[task_id_state, upload_status]
     )
     
-    def on_ocr_click(task_id, pre, den, bin, des, dpi):
-        msg = start_ocr_process(task_id, pre, den, bin, des, dpi)
-        return msg, True # 启动定时器
+    async def on_ocr_click(task_id, pre, den, bin, des, dpi):
+        msg = await start_ocr_process(task_id, pre, den, bin, des, dpi)
+        yield msg, gr.update(), gr.update()
+        if not task_id or msg.startswith("启动失败"):
+            return
+        
+        # 按后端推送刷新进度，完成后自动加载结果
+        # 页面识别很快时推送密集，间隔不足 UI_UPDATE_INTERVAL 的中间状态直接丢弃
+        last_emit = 0.0
+        # 先看到本次任务的 pending/processing 状态，之后的 completed 才是本次结果
+        seen_active = False
+        try:
+            async for status_text, prog, status in stream_status(task_id):
+                if status == "completed":
+                    result = await get_ocr_result(task_id, cache_result=seen_active)
+                    yield status_text, prog, result
+                    continue
+                if status in ("pending", "processing"):
+                    seen_active = True
+                now = time.monotonic()
+                if status == "failed" or now - last_emit >= UI_UPDATE_INTERVAL:
+                    last_emit = now
+                    yield status_text, prog, gr.update()
+        except Exception as e:
+            yield f"查询失败: {str(e)}", gr.update(), gr.update()
         
     ocr_btn.click(
         on_ocr_click,
         inputs=[task_id_state, preprocess_chk, denoise_chk, binarize_chk, deskew_chk, dpi_slider],
-        outputs=[status_box, timer]
-    )
-    
-    def on_timer_tick(task_id):
-        msg, prog, status = check_status(task_id)
-        
-        # 如果完成或失败，停止定时器
-        active = True
-        if status in ["completed", "failed"]:
-            active = False
-            
-        # 如果完成，自动加载结果
-        res_text = gr.UPDATE
-        if status == "completed":
-            res_text = get_ocr_result(task_id)
-            
-        return msg, prog, active, res_text
-        
-    timer.tick(
-        on_timer_tick,
-        inputs=[task_id_state],
-        outputs=[status_box, progress_bar, timer, result_preview]
+        outputs=[status_box, progress_bar, result_preview],
+        # 进度推送持续整个识别过程，且只在等待后端推送，不占用队列并发名额
+        concurrency_limit=None
     )
     
     export_btn.click(
@@ -217,11 +288,13 @@ with gr.Blocks(title="SmartPDF-OCR") as demo:
         inputs=[task_id_state, format_radio],
         outputs=[download_file, export_msg]
     )
+    
+    demo.load(load_engine_info, outputs=[denoise_chk, binarize_chk])
 
 if __name__ == "__main__":
-    demo.queue().launch(
+    demo.queue(default_concurrency_limit=QUEUE_CONCURRENCY, max_size=QUEUE_MAX_SIZE).launch(
         server_name="0.0.0.0", 
         server_port=7860,
         share=False,
-        theme=gr.themes.Soft()
+        theme=THEME
     )
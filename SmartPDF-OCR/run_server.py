@@ -5,6 +5,7 @@ Supports both development and packaged (PyInstaller) environments.
 
 import sys
 import argparse
+import multiprocessing
 import uvicorn
 
 
@@ -13,17 +14,35 @@ def main():
     parser.add_argument("--host", type=str, default="127.0.0.1", help="Host to bind")
     parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
     parser.add_argument("--reload", action="store_true", help="Enable hot reload (dev only)")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Number of worker processes (ignored with --reload; >1 requires REDIS_URL)"
+    )
     args = parser.parse_args()
     
-    print(f"Starting SmartPDF-OCR Server on http://{args.host}:{args.port}...")
+    # 每个 worker 各自加载 OCR 模型并创建进程池；任务状态默认保存在进程内，
+    # 多 worker 时需配置 REDIS_URL，否则状态查询可能落到其他 worker 上
+    workers = 1 if args.reload else max(args.workers, 1)
+    if workers > 1:
+        from app.config import settings
+        if not settings.REDIS_URL:
+            print("Warning: --workers > 1 without REDIS_URL, task status is not shared; using 1 worker")
+            workers = 1
+    
+    print(f"Starting SmartPDF-OCR Server on http://{args.host}:{args.port} ({workers} worker(s))...")
     
+    # loop/http 保持 auto：安装了 uvicorn[standard] 时自动使用 uvloop 与 httptools，
+    # Windows 或未安装时回退到 asyncio 与 h11
     uvicorn.run(
         "app.main:app",
         host=args.host,
         port=args.port,
-        reload=args.reload
+        reload=args.reload,
+        workers=workers
     )
 
 
 if __name__ == "__main__":
+    # 打包环境下预处理进程池的子进程需要此调用
+    multiprocessing.freeze_support()
     main()